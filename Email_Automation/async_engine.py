@@ -0,0 +1,235 @@
+# async_engine module
+# Module holds the class => AsyncEngine - runs the Weekly Email Process on an asyncio event loop
+# Class responsible for running the ticket search, account lookup, ftp posting, email and Jira updates as coroutines,
+# the blocking Jira, sFTP and smtp calls are run on a thread executor, each backend limited by its own semaphore
+#
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+
+
+class AsyncEngine(object):
+    def __init__(self, manager, jira_limit):
+        self.manager = manager
+        self.jira_limit = jira_limit
+        self.sftp_limit = manager.sftp_max_connections
+        self.smtp_limit = 1
+        self.executor = None
+        self.jira_semaphore = None
+        self.sftp_semaphore = None
+        self.smtp_semaphore = None
+        # key of the parent ticket whose coroutine is running, set per ticket task and handed to the executor threads so
+        # their Jira, sFTP and smtp samples are recorded against the ticket
+        self.ticket = contextvars.ContextVar('ticket', default=None)
+        # seconds the ticket's calls have spent queued on the backend semaphores, and the start of the current wait,
+        # left out of its task timeout
+        self.queued = contextvars.ContextVar('queued', default=None)
+        self.logger = logging.getLogger(__name__)
+
+    # Runs the process on a new event loop
+    #
+    def run(self):
+        asyncio.run(self.process_manager())
+
+    # Runs a blocking call on the executor once the backend semaphore allows it
+    #
+    async def call(self, semaphore, function_call, *args, **kwargs):
+        queued = self.queued.get()
+        if queued is not None:
+            queued["since"] = time.perf_counter()
+        async with semaphore:
+            if queued is not None:
+                queued["seconds"] += time.perf_counter() - queued["since"]
+                queued["since"] = None
+            return await self.blocking(function_call, *args, **kwargs)
+
+    # Runs a blocking Jira, sFTP or smtp call within that backend's limit
+    #
+    async def jira(self, function_call, *args, **kwargs):
+        return await self.call(self.jira_semaphore, function_call, *args, **kwargs)
+
+    async def sftp(self, function_call, *args, **kwargs):
+        return await self.call(self.sftp_semaphore, function_call, *args, **kwargs)
+
+    async def smtp(self, function_call, *args, **kwargs):
+        return await self.call(self.smtp_semaphore, function_call, *args, **kwargs)
+
+    # Awaits the coroutine as a timed sample of the stage, the coroutines of a ticket share the event loop thread so
+    # the ticket is recorded with the sample rather than set as the thread's current ticket
+    #
+    async def timed(self, name, coroutine, ticket=None):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = await coroutine
+            ok = True
+            return result
+        finally:
+            self.manager.metrics.record(name, time.perf_counter() - start, ticket, ok=ok)
+
+    # Runs a blocking local call (ZFS file reads, connection setup) on the executor
+    #
+    async def blocking(self, function_call, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(self.manager.metrics.run_as, self.ticket.get(), function_call, *args, **kwargs))
+
+    # Manages the process for finding tickets, looking up the account data, then runs every ticket's ftp posting and
+    # email as its own coroutine
+    #
+    async def process_manager(self):
+        manager = self.manager
+        self.jira_semaphore = asyncio.Semaphore(self.jira_limit)
+        self.sftp_semaphore = asyncio.Semaphore(self.sftp_limit)
+        self.smtp_semaphore = asyncio.Semaphore(self.smtp_limit)
+
+        with ThreadPoolExecutor(max_workers=self.jira_limit + self.sftp_limit + self.smtp_limit + 1,
+                                thread_name_prefix='async') as self.executor:
+            # pulls desired tickets running jql
+            manager.parent_tickets = await self.timed("run.discovery", self.jira(manager.parent_tickets_find))
+            manager.metrics.count("tickets_found", len(manager.parent_tickets))
+            self.logger.info("{} ticket(s) were found.".format(len(manager.parent_tickets)))
+            self.logger.info(str([ticket.key for ticket in manager.parent_tickets]) + "\n")
+
+            if manager.parent_tickets:
+                # reads the account file from ZFS1 once for the run, ticket lookups are then served from the index
+                await self.timed("run.excel_index", self.blocking(manager.excel_index_build))
+                # fetches the parent ticket level information and account data for all parent tickets concurrently,
+                # the parent tickets that fail are dropped
+                parent_tickets = await self.timed("run.enrichment", asyncio.gather(
+                    *[self.jira(manager.parent_enrichment, ticket) for ticket in manager.parent_tickets],
+                    return_exceptions=True))
+                for parent_ticket, result in zip(manager.parent_tickets, parent_tickets):
+                    if isinstance(result, Exception):
+                        self.logger.error("Parent Ticket: {}, enrichment failed => {}"
+                                          .format(parent_ticket.key, result))
+                manager.good_parent_tickets = [ticket for ticket in parent_tickets
+                                               if ticket is not None and not isinstance(ticket, Exception)]
+                self.logger.info("\n")
+
+                child_pulls = []
+                # open the ftp connections and pull the sub-tasks for ftp posting
+                if manager.running_mode in manager.run_sftp:
+                    await self.timed("run.sftp_connect", self.blocking(manager.sftp_connect))
+                    child_pulls.append(self.jira(manager.child_tickets_pull, manager.jira_status_child_sftp))
+                else:
+                    self.logger.info("\t***This run was specified to omit ftp posting.***\n")
+
+                # pull the sub-tasks already posted that are still waiting on an email
+                if manager.running_mode in manager.run_email:
+                    manager.smtp_session = manager.smtp_session_create()
+                    child_pulls.append(self.jira(manager.child_tickets_pull, manager.jira_status_child_email))
+                else:
+                    self.logger.info("\t***This run was specified to omit email sending.***\n")
+
+                child_tickets = await asyncio.gather(*child_pulls)
+                if manager.running_mode in manager.run_sftp:
+                    manager.sftp_child_tickets = child_tickets.pop(0)
+                if manager.running_mode in manager.run_email:
+                    manager.email_child_tickets = child_tickets.pop(0)
+
+                # run every ticket's ftp posting and email as its own coroutine
+                self.logger.info("=> Beginning the ticket level - asyncio processing.")
+                results = await self.timed("run.tickets", asyncio.gather(
+                    *[self.ticket_task(ticket) for ticket in manager.good_parent_tickets], return_exceptions=True))
+                for ticket, result in zip(manager.good_parent_tickets, results):
+                    if isinstance(result, Exception):
+                        self.logger.error("Parent Ticket: {} failed => {}".format(ticket[0].key, result))
+                self.logger.info("=> Finished the ticket level - asyncio processing.\n")
+
+                # write the Jira updates for the emails sent
+                await self.timed("run.email_write_back", self.jira(manager.email_write_back))
+            else:
+                self.logger.warning("There were no tickets found with the required criteria to report on.")
+
+    # Runs the ticket's ftp posting then its email, a ticket over the task timeout is logged but not cancelled, as its
+    # call running in the executor can't be stopped and its email would go out without its Jira update, the time the
+    # ticket spends queued on the backend semaphores behind the other tickets doesn't count towards its timeout, as a
+    # ticket of the thread engine is only timed once a worker runs it
+    #
+    async def ticket_task(self, parent_ticket):
+        manager = self.manager
+        queued = {"seconds": 0.0, "since": None}
+        self.ticket.set(parent_ticket[0].key)
+        self.queued.set(queued)
+        start = time.perf_counter()
+        task = asyncio.ensure_future(self.ticket_pipeline(parent_ticket))
+        while manager.task_timeout:
+            now = time.perf_counter()
+            waiting = now - queued["since"] if queued["since"] is not None else 0
+            remaining = start + queued["seconds"] + waiting + manager.task_timeout - now
+            if remaining <= 0:
+                break
+            await asyncio.wait({task}, timeout=remaining)
+            if task.done():
+                break
+        if manager.task_timeout and not task.done():
+            self.logger.error("Parent Ticket: {} did not finish within {} second(s), waiting on it as its ftp posting "
+                              "or email may still complete".format(parent_ticket[0].key, manager.task_timeout))
+        await task
+
+    # Runs the ftp posting and the email as required by the running mode, the email follows its own ticket's posting
+    #
+    async def ticket_pipeline(self, parent_ticket):
+        manager = self.manager
+        child_ticket_email = None
+        if manager.running_mode in manager.run_sftp:
+            # a failed ftp posting still falls through to the email of a child ticket already posted
+            try:
+                child_ticket_email = await self.timed("ticket.sftp", self.ticket_sftp(parent_ticket),
+                                                      parent_ticket[0].key)
+            except Exception as e:
+                self.logger.error("Parent Ticket: {}, the ftp posting failed => {}".format(parent_ticket[0].key, e))
+                manager.metrics.count("tickets_failed")
+        if manager.running_mode in manager.run_email:
+            await self.timed("ticket.email", self.ticket_email(parent_ticket, child_ticket_email), parent_ticket[0].key)
+
+    # Posts the zip file of the parent ticket's child ticket, updates the child ticket and returns it once its
+    # progress to 'Complete' is confirmed, running the manager's ftp steps each on its backend's slot
+    #
+    async def ticket_sftp(self, parent_ticket):
+        manager = self.manager
+        sftp_ticket = await self.jira(manager.sftp_ticket_info, parent_ticket)
+        if sftp_ticket is None:
+            return None
+        child_ticket_sftp, zip_file_zfs_path, zip_file_name = sftp_ticket
+
+        ftp_file = await self.sftp(manager.sftp_ticket_post, child_ticket_sftp, zip_file_zfs_path, zip_file_name)
+        if ftp_file is None:
+            return None
+
+        outcome = await self.jira(manager.ticket_modifier_sftp, child_ticket_sftp, ftp_file, zip_file_name)
+        if not manager.sftp_ticket_transitioned(outcome):
+            return manager.sftp_ticket_confirm(child_ticket_sftp, False)
+        progressed = await self.timed("ticket.sftp_status_wait",
+                                      self.wait_for_status(child_ticket_sftp, manager.jira_status_child_email),
+                                      parent_ticket[0].key)
+        return manager.sftp_ticket_confirm(child_ticket_sftp, progressed)
+
+    # Sends the email for the child ticket just posted, or for the child ticket already posted, and updates it, running
+    # the manager's email steps each on its backend's slot
+    #
+    async def ticket_email(self, parent_ticket, child_ticket_email=None):
+        manager = self.manager
+        child_ticket_email = await self.jira(manager.email_ticket_info, parent_ticket, child_ticket_email)
+        if child_ticket_email is None:
+            return
+        email_file = await self.smtp(manager.email_ticket_send, parent_ticket, child_ticket_email)
+        if email_file is not None:
+            await self.jira(manager.email_ticket_record, child_ticket_email, email_file)
+
+    # Polls the child ticket status as JiraManager.wait_for_status does, without holding a Jira slot or an executor
+    # thread between polls, returns False on timeout
+    #
+    async def wait_for_status(self, ticket, status):
+        manager = self.manager
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + manager.jira_status_poll_timeout
+        while True:
+            if await self.jira(manager.jira_pars.status_reached, ticket, status):
+                return True
+            if loop.time() + manager.jira_status_poll_interval > deadline:
+                return False
+            await asyncio.sleep(manager.jira_status_poll_interval)
@@ -0,0 +1,4 @@
+# benchmark package
+# Package holds the local stand-in backends (fake Jira, smtp and sFTP servers) and the end-to-end benchmark harness
+# for the Weekly Email Process, none of it is used by a production run
+#
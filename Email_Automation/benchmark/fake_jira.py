@@ -0,0 +1,281 @@
+# fake_jira module
+# Module holds the class => FakeJira - manages a local stand-in for the Jira REST API
+# Class responsible for serving the Jira endpoints used by the automation (server info, search, issue read and edit,
+# comments, attachments, transitions and session end) from an in-memory ticket store, with an injected latency per
+# request and a count of the requests served per endpoint
+#
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from email.parser import BytesParser
+from collections import Counter
+from datetime import datetime
+import threading
+import json
+import time
+import re
+
+
+class FakeJira(object):
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0, page_size=50):
+        self.latency = latency
+        self.page_size = page_size
+        self.issues = {}
+        self.comments = {}
+        self.attachments = {}
+        # transition id => the status it moves a ticket to
+        self.transitions = {'621': 'Complete'}
+        self.request_counts = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    # Returns the base url of the running server
+    #
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server.server_address)
+
+    # Serves requests on a background thread
+    #
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-jira', daemon=True)
+        self.thread.start()
+        return self
+
+    # Stops serving and closes the listening socket
+    #
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Adds a ticket to the store, the fields are given in their Jira REST form
+    #
+    def add_issue(self, key, **fields):
+        fields.setdefault('labels', [])
+        fields.setdefault('updated', self.timestamp())
+        fields.setdefault('created', fields['updated'])
+        with self.lock:
+            self.issues[key] = fields
+            self.comments[key] = []
+            self.attachments[key] = []
+
+    # Returns a copy of the stored fields of the ticket
+    #
+    def fields(self, key):
+        with self.lock:
+            return dict(self.issues[key])
+
+    # Returns the current time in the Jira timestamp format
+    #
+    @staticmethod
+    def timestamp():
+        return datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+    # Returns the ticket in its REST form, limited to the requested fields
+    #
+    def issue_json(self, key, fields=None):
+        issue_fields = self.issues[key]
+        if fields and '*all' not in fields:
+            issue_fields = {field: value for field, value in issue_fields.items() if field in fields}
+        return {"id": key.split('-')[-1], "key": key, "self": "{}/rest/api/2/issue/{}".format(self.url, key),
+                "fields": issue_fields}
+
+    # Returns the keys of the stored tickets matching the jql query, ordered by key number
+    #
+    def search(self, jql):
+        clauses = re.split(r'\s+ORDER\s+BY\s+', jql, flags=re.IGNORECASE)[0]
+        conditions = [self.parse_clause(clause) for clause in re.split(r'\s+AND\s+', clauses, flags=re.IGNORECASE)]
+        with self.lock:
+            keys = [key for key, fields in self.issues.items()
+                    if all(self.matches(key, fields, *condition) for condition in conditions)]
+        return sorted(keys, key=lambda key: (key.split('-')[0], int(key.split('-')[-1])))
+
+    # Splits a jql clause into its field, operator and value (a list for 'in' clauses)
+    #
+    @staticmethod
+    def parse_clause(clause):
+        match = re.match(r'\s*(\w+)\s+(not in|in|!=|>=|<=|=|~|>|<)\s*(.+?)\s*$', clause, flags=re.IGNORECASE)
+        if match is None:
+            raise ValueError("Unsupported jql clause: {}".format(clause))
+        field, operator, value = match.group(1).lower(), match.group(2).lower(), match.group(3)
+        if value.startswith('('):
+            value = [item.strip().strip('\'"') for item in value.strip('()').split(',')]
+        else:
+            value = value.strip('\'"')
+        return field, operator, value
+
+    # Returns whether the ticket satisfies a single jql condition
+    #
+    def matches(self, key, fields, field, operator, value):
+        if field == 'summary' and operator == '~':
+            summary = fields.get('summary', '').lower()
+            terms = value.lower().split()
+            return all(term[1:] not in summary if term.startswith('-') else term in summary for term in terms)
+        if field in ('updated', 'created'):
+            issue_time = datetime.strptime(fields[field][:19], '%Y-%m-%dT%H:%M:%S')
+            query_time = datetime.strptime(value.replace('/', '-')[:16], '%Y-%m-%d %H:%M')
+            return {'>=': issue_time >= query_time, '>': issue_time > query_time,
+                    '<=': issue_time <= query_time, '<': issue_time < query_time}[operator]
+
+        if field == 'key':
+            actual = [key]
+        elif field == 'project':
+            actual = [key.split('-')[0]]
+        elif field == 'labels':
+            actual = fields.get('labels') or []
+        else:
+            actual = fields.get(field)
+            actual = [actual.get('key', actual.get('name')) if isinstance(actual, dict) else actual]
+        actual = [str(item).lower() for item in actual]
+        values = [str(item).lower() for item in (value if isinstance(value, list) else [value])]
+        found = any(item in actual for item in values)
+        return not found if operator in ('not in', '!=') else found
+
+    # Applies an edit to the ticket, the 'updated' time stamp moves on with every change
+    #
+    def edit(self, key, fields=None, status=None):
+        with self.lock:
+            if fields:
+                self.issues[key].update(fields)
+            if status is not None:
+                self.issues[key]['status'] = {"name": status}
+            self.issues[key]['updated'] = self.timestamp()
+
+    # Creates the request handler class bound to this fake
+    #
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, without this each response waits on the delayed ack
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fake.dispatch(self, 'GET')
+
+            def do_POST(self):
+                fake.dispatch(self, 'POST')
+
+            def do_PUT(self):
+                fake.dispatch(self, 'PUT')
+
+            def do_DELETE(self):
+                fake.dispatch(self, 'DELETE')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    # Routes the request to its endpoint after the injected latency, unknown paths and tickets are answered 404
+    #
+    def dispatch(self, request, method):
+        url = urlparse(request.path)
+        # a repeated parameter (the field list is sent once per field) is joined with commas
+        query = {name: ",".join(values) for name, values in parse_qs(url.query).items()}
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0))
+        time.sleep(self.latency)
+
+        routes = [
+            ('GET', r'/rest/api/2/serverInfo$', self.server_info),
+            ('GET', r'/rest/api/2/field$', self.field_list),
+            ('GET', r'/rest/api/2/myself$', self.myself),
+            ('GET', r'/rest/api/2/search$', self.search_page),
+            ('GET', r'/rest/api/2/issue/([^/]+)$', self.get_issue),
+            ('PUT', r'/rest/api/2/issue/([^/]+)$', self.put_issue),
+            ('POST', r'/rest/api/2/issue/([^/]+)/comment$', self.post_comment),
+            ('POST', r'/rest/api/2/issue/([^/]+)/attachments$', self.post_attachment),
+            ('POST', r'/rest/api/2/issue/([^/]+)/transitions$', self.post_transition),
+            ('DELETE', r'/rest/auth/(?:1|latest)/session$', self.delete_session)
+        ]
+        for route_method, pattern, endpoint in routes:
+            match = re.match(pattern, url.path)
+            if route_method == method and match:
+                with self.lock:
+                    self.request_counts["{} {}".format(method, endpoint.__name__)] += 1
+                    known = all(key in self.issues for key in match.groups())
+                if not known:
+                    return self.respond(request, 404, {"errorMessages": ["Issue Does Not Exist"]})
+                try:
+                    status, payload = endpoint(query, body, request.headers, *match.groups())
+                except ValueError as e:
+                    status, payload = 400, {"errorMessages": [str(e)]}
+                return self.respond(request, status, payload)
+        self.respond(request, 404, {"errorMessages": ["No route for {} {}".format(method, url.path)]})
+
+    # Writes the json response, or an empty response for 204
+    #
+    @staticmethod
+    def respond(request, status, payload=None):
+        content = b"" if status == 204 else json.dumps(payload).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json;charset=UTF-8')
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def server_info(self, query, body, headers):
+        return 200, {"baseUrl": self.url, "version": "7.13.0", "versionNumbers": [7, 13, 0],
+                     "deploymentType": "Server", "serverTitle": "Fake Jira", "serverTime": self.timestamp()}
+
+    def myself(self, query, body, headers):
+        return 200, {"name": "benchmark", "key": "benchmark", "timeZone": "UTC"}
+
+    def field_list(self, query, body, headers):
+        return 200, [{"id": field, "name": field, "custom": field.startswith('customfield_')}
+                     for field in ('summary', 'status', 'labels', 'duedate', 'parent', 'reporter', 'customfield_10431',
+                                   'customfield_10418')]
+
+    def search_page(self, query, body, headers):
+        keys = self.search(query['jql'])
+        start_at = int(query.get('startAt', 0))
+        max_results = min(int(query.get('maxResults', self.page_size)), self.page_size)
+        fields = query['fields'].split(',') if query.get('fields') else None
+        with self.lock:
+            issues = [self.issue_json(key, fields) for key in keys[start_at:start_at + max_results]]
+        return 200, {"startAt": start_at, "maxResults": max_results, "total": len(keys), "issues": issues}
+
+    def get_issue(self, query, body, headers, key):
+        fields = query['fields'].split(',') if query.get('fields') else None
+        with self.lock:
+            return 200, self.issue_json(key, fields)
+
+    def put_issue(self, query, body, headers, key):
+        self.edit(key, fields=json.loads(body.decode('utf-8')).get('fields', {}))
+        return 204, None
+
+    def post_comment(self, query, body, headers, key):
+        comment = json.loads(body.decode('utf-8'))
+        with self.lock:
+            self.comments[key].append(comment['body'])
+            comment_id = str(sum(len(comments) for comments in self.comments.values()))
+        self.edit(key)
+        return 201, {"id": comment_id, "body": comment['body'],
+                     "self": "{}/rest/api/2/issue/{}/comment/{}".format(self.url, key, comment_id)}
+
+    def post_attachment(self, query, body, headers, key):
+        message = BytesParser().parsebytes(
+            "Content-Type: {}\r\n\r\n".format(headers['Content-Type']).encode('utf-8') + body)
+        if not message.is_multipart():
+            raise ValueError("The attachment request was not a multipart body")
+        attached = []
+        for part in message.get_payload():
+            content = part.get_payload(decode=True)
+            with self.lock:
+                self.attachments[key].append((part.get_filename(), part.get_content_type(), content))
+            attached.append({"filename": part.get_filename(), "mimeType": part.get_content_type(),
+                             "size": len(content)})
+        self.edit(key)
+        return 200, attached
+
+    def post_transition(self, query, body, headers, key):
+        transition_id = str(json.loads(body.decode('utf-8'))['transition']['id'])
+        if transition_id not in self.transitions:
+            raise ValueError("Transition id {} is not valid for this issue".format(transition_id))
+        self.edit(key, status=self.transitions[transition_id])
+        return 204, None
+
+    def delete_session(self, query, body, headers):
+        return 204, None
@@ -0,0 +1,186 @@
+# fake_sftp module
+# Module holds the class => FakeSFTP - manages a local sFTP server
+# Class responsible for accepting ssh connections with any public key and serving the sftp subsystem from a local root
+# directory, with an injected latency per sftp operation and a count of the bytes written
+# Module also holds the classes => FakeSSHServer, FakeSFTPInterface and FakeSFTPHandle - the paramiko server side
+#
+import paramiko
+import socket
+import threading
+import time
+import os
+
+
+class FakeSFTP(object):
+    def __init__(self, root, latency=0.0, host='127.0.0.1', port=0):
+        self.root = root
+        self.latency = latency
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.bytes_written = 0
+        self.operations = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.transports = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.running = False
+        self.thread = None
+
+    # Returns the host and port of the running server
+    #
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    # Writes a known hosts file holding the server's host key, for the client's host key check
+    #
+    def write_known_hosts(self, path):
+        with open(path, 'w') as file:
+            file.write("{} {} {}\n".format(self.address[0], self.host_key.get_name(), self.host_key.get_base64()))
+        return path
+
+    # Accepts connections on a background thread
+    #
+    def start(self):
+        self.sock.listen(16)
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name='fake-sftp', daemon=True)
+        self.thread.start()
+        return self
+
+    # Starts an ssh transport with the sftp subsystem for each connection
+    #
+    def serve(self):
+        while self.running:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, FakeSFTPInterface, fake=self)
+            transport.start_server(server=FakeSSHServer())
+            with self.lock:
+                self.connections += 1
+                self.transports.append(transport)
+
+    # Closes the open transports and the listening socket
+    #
+    def stop(self):
+        self.running = False
+        self.sock.close()
+        with self.lock:
+            for transport in self.transports:
+                transport.close()
+
+    # Counts an sftp operation and applies the injected latency
+    #
+    def operation(self, bytes_written=0):
+        time.sleep(self.latency)
+        with self.lock:
+            self.operations += 1
+            self.bytes_written += bytes_written
+
+
+class FakeSSHServer(paramiko.ServerInterface):
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class FakeSFTPHandle(paramiko.SFTPHandle):
+    def __init__(self, fake, flags=0):
+        super(FakeSFTPHandle, self).__init__(flags)
+        self.fake = fake
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def write(self, offset, data):
+        self.fake.operation(len(data))
+        return super(FakeSFTPHandle, self).write(offset, data)
+
+
+class FakeSFTPInterface(paramiko.SFTPServerInterface):
+    def __init__(self, server, fake=None):
+        super(FakeSFTPInterface, self).__init__(server)
+        self.fake = fake
+
+    # Maps the remote path onto the local root directory
+    #
+    def local_path(self, path):
+        return os.path.join(self.fake.root, self.canonicalize(path).lstrip('/'))
+
+    def list_folder(self, path):
+        self.fake.operation()
+        try:
+            local_path = self.local_path(path)
+            entries = []
+            for file_name in os.listdir(local_path):
+                attribute = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local_path, file_name)))
+                attribute.filename = file_name
+                entries.append(attribute)
+            return entries
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        self.fake.operation()
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.local_path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        return self.stat(path)
+
+    def open(self, path, flags, attr):
+        self.fake.operation()
+        try:
+            fd = os.open(self.local_path(path), flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = FakeSFTPHandle(self.fake, flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        self.fake.operation()
+        try:
+            os.remove(self.local_path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        self.fake.operation()
+        try:
+            os.rename(self.local_path(oldpath), self.local_path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        self.fake.operation()
+        try:
+            os.mkdir(self.local_path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
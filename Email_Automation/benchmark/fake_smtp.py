@@ -0,0 +1,84 @@
+# fake_smtp module
+# Module holds the class => FakeSMTP - manages a local smtp sink
+# Class responsible for accepting smtp connections, answering the commands used by smtplib and keeping every message
+# received, with an injected latency per message
+#
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from email import message_from_bytes
+from email.policy import default
+import threading
+import time
+
+
+class FakeSMTP(object):
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingTCPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    # Returns the host and port of the running server
+    #
+    @property
+    def address(self):
+        return self.server.server_address
+
+    # Serves connections on a background thread
+    #
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-smtp', daemon=True)
+        self.thread.start()
+        return self
+
+    # Stops serving and closes the listening socket
+    #
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Keeps a received message after the injected latency
+    #
+    def receive(self, data):
+        time.sleep(self.latency)
+        with self.lock:
+            self.messages.append(message_from_bytes(data, policy=default))
+
+    # Creates the connection handler class bound to this fake
+    #
+    def handler(self):
+        fake = self
+
+        class Handler(StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write("{}\r\n".format(line).encode('ascii'))
+
+            def handle(self):
+                with fake.lock:
+                    fake.connections += 1
+                self.reply("220 fake-smtp ready")
+                for line in self.rfile:
+                    command = line.decode('ascii', 'replace').strip().split(' ')[0].upper()
+                    if command in ('EHLO', 'HELO'):
+                        self.reply("250 fake-smtp")
+                    elif command in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                        self.reply("250 OK")
+                    elif command == 'DATA':
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = []
+                        for data_line in self.rfile:
+                            if data_line in (b".\r\n", b".\n"):
+                                break
+                            # undo the dot-stuffing of lines starting with a '.'
+                            data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                        fake.receive(b"".join(data))
+                        self.reply("250 OK: queued")
+                    elif command == 'QUIT':
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        return Handler
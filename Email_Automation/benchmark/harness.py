@@ -0,0 +1,287 @@
+# harness module
+# Module holds the class => BenchmarkHarness - manages an end-to-end benchmark run of the Weekly Email Process
+# Class responsible for building N synthetic tickets, the account workbook and the zip files, starting the fake Jira,
+# smtp and sFTP backends with their injected latencies, running the Data Enablement Email Manager against them, then
+# checking every ticket was processed and reporting the timings
+#
+# Run from the Email_Automation directory, e.g. -> python -m benchmark.harness --tickets 50 --jira-latency 0.05
+# With --crash-rerun a first run crashes before its end and the timed run is the rerun resuming from the run journal
+#
+from datetime import datetime
+from io import StringIO
+import argparse
+import tempfile
+import statistics
+import shutil
+import random
+import time
+import json
+import os
+import logging
+
+from openpyxl import Workbook
+
+from benchmark.fake_jira import FakeJira
+from benchmark.fake_smtp import FakeSMTP
+from data_enablement_email_manager import DataEnablementEmailManager
+
+
+class BenchmarkHarness(object):
+    def __init__(self, tickets=20, zip_size=1048576, running_mode='3', engine='threads', max_workers=8,
+                 sftp_connections=4, jira_latency=0.0, smtp_latency=0.0, sftp_latency=0.0, seed=0, keep=False,
+                 crash_rerun=False):
+        self.tickets = tickets
+        self.zip_size = zip_size
+        self.running_mode = running_mode
+        self.engine = engine
+        self.max_workers = max_workers
+        self.sftp_connections = sftp_connections
+        self.jira_latency = jira_latency
+        self.smtp_latency = smtp_latency
+        self.sftp_latency = sftp_latency
+        self.seed = seed
+        self.keep = keep
+        self.crash_rerun = crash_rerun
+        self.start_date = '2026-10-05'
+        self.end_date = '2026-10-11'
+        self.work_dir = None
+        self.client_key = None
+        self.jira = None
+        self.smtp = None
+        self.sftp = None
+        self.logger = logging.getLogger(__name__)
+
+    # Creates the work directory, the synthetic tickets, workbook and zip files, and starts the fake backends
+    #
+    def setup(self):
+        self.work_dir = tempfile.mkdtemp(prefix='deem_benchmark_')
+        for folder in ('excel', 'zfs', 'sftp'):
+            os.mkdir(os.path.join(self.work_dir, folder))
+
+        self.jira = FakeJira(latency=self.jira_latency).start()
+        self.smtp = FakeSMTP(latency=self.smtp_latency).start()
+        # the sFTP server (and paramiko) is only started for the running modes that post zip files
+        if self.running_mode in ('1', '3'):
+            import paramiko
+            from benchmark.fake_sftp import FakeSFTP
+            self.sftp = FakeSFTP(os.path.join(self.work_dir, 'sftp'), latency=self.sftp_latency).start()
+            self.sftp.write_known_hosts(os.path.join(self.work_dir, 'known_hosts'))
+            client_key = paramiko.RSAKey.generate(2048)
+            self.client_key = StringIO()
+            client_key.write_private_key(self.client_key)
+
+        random.seed(self.seed)
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = 'Sheet1'
+        for i in range(1, self.tickets + 1):
+            parent_key, child_key = "CAM-{}".format(i), "CAM-{}".format(self.tickets + i)
+            customer_name = "Customer{}".format(i)
+            self.jira.add_issue(parent_key, summary="Data License Turn - {}".format(customer_name),
+                                issuetype={"name": "Opportunity"}, status={"name": "Open"},
+                                reporter={"key": "reporter", "name": "reporter"})
+            child_status = 'Post Processing' if self.running_mode in ('1', '3') else 'Complete'
+            self.jira.add_issue(child_key, summary="Weekly delivery - {}".format(customer_name),
+                                issuetype={"name": "Sub-task"}, status={"name": child_status},
+                                parent={"key": parent_key}, labels=['ZipFile_Created'],
+                                reporter={"key": "reporter", "name": "reporter"},
+                                customfield_10431=self.start_date, customfield_10418=self.end_date, duedate=None)
+            sheet.append([parent_key, 1000 + i, None, 2000 + i, None, None, 3000 + i])
+
+            zip_dir = os.path.join(self.work_dir, 'zfs', parent_key, child_key)
+            os.makedirs(zip_dir)
+            with open(os.path.join(zip_dir, "{}_{}_{}.zip".format(customer_name, self.start_date, self.end_date)),
+                      'wb') as file:
+                file.write(random.getrandbits(8 * self.zip_size).to_bytes(self.zip_size, 'little')
+                           if self.zip_size else b"")
+        workbook.save(os.path.join(self.work_dir, 'excel', 'accounts.xlsx'))
+
+    # Returns the configuration parameters of a run against the fake backends, as read from config.ini by main
+    #
+    def config_params(self):
+        sftp_address = self.sftp.address if self.sftp is not None else ("127.0.0.1", 22)
+        return {
+            "email_file_name":          "Weekly_Email",
+            "running_mode":             self.running_mode,
+            "max_workers":              self.max_workers,
+            "task_timeout":             600,
+            "io_timeout":               60,
+            "engine":                   self.engine,
+            "async_jira_limit":         32,
+            "journal_file":             os.path.join(self.work_dir, 'run_journal.jsonl'),
+            "keep_warm":                False,
+            "sftp_server":              "127.0.0.1",
+            "jira_url":                 self.jira.url,
+            "jira_token":               ("benchmark", "benchmark"),
+            "jql_status_parent":        "('Open', 'Reopened')",
+            "jql_status_child_sftp":    "'Post Processing'",
+            "jql_status_child_email":   "'Complete'",
+            "jira_status_poll_interval": 0.05,
+            "jira_status_poll_timeout": 30,
+            "jql_issuetype":            "Opportunity",
+            "jql_label":                "'ZipFile_Created'",
+            "jql_text":                 "'Turn -Test'",
+            "jira_discovery_cache_file": os.path.join(self.work_dir, 'parent_ticket_cache.json'),
+            "jira_discovery_overlap":   10,
+            "jira_discovery_rescan_days": 7,
+            "jira_full_rescan":         False,
+            "ssh_key":                  self.client_key.getvalue() if self.client_key is not None else "",
+            "sftp_url":                 sftp_address[0],
+            "sftp_port":                sftp_address[1],
+            "sftp_known_hosts":         os.path.join(self.work_dir, 'known_hosts'),
+            "sftp_user":                "benchmark",
+            "sftp_folder_path":         "/",
+            "sftp_max_connections":     self.sftp_connections,
+            "sftp_resume_uploads":      True,
+            "sftp_chunk_size":          8388608,
+            "sftp_manifest_file":       os.path.join(self.work_dir, 'delivery_manifest.jsonl'),
+            "sftp_zip_file_path":       os.path.join(self.work_dir, 'zfs', ''),
+            "excel_path":               os.path.join(self.work_dir, 'excel'),
+            "excel_cache_file":         os.path.join(self.work_dir, 'account_index_cache.json'),
+            "email_subject":            "Weekly Data Delivery",
+            "email_to":                 "to@example.com",
+            "email_from":               "from@example.com",
+            "email_cc":                 "cc@example.com",
+            "email_mail_host":          self.smtp.address[0],
+            "email_mail_port":          self.smtp.address[1],
+            "metrics_file":             "",
+            "metrics_textfile":         ""
+        }
+
+    # Runs the full process once against the fake backends, returns the timings, the request counts and the check of
+    # the end state of every ticket
+    #
+    def run(self):
+        self.setup()
+        try:
+            if self.crash_rerun:
+                self.crash_run()
+            start = time.perf_counter()
+            de_emailer = DataEnablementEmailManager(self.config_params())
+            de_emailer.process_manager()
+            elapsed = time.perf_counter() - start
+            return self.result(elapsed, de_emailer.run_summary())
+        finally:
+            self.teardown()
+
+    # Runs the process up to a crash before its end, the Jira email write-back raising (or the close of the run when
+    # it omits the email), leaving the stages it completed in the run journal for the rerun to resume from
+    #
+    def crash_run(self):
+        de_emailer = DataEnablementEmailManager(self.config_params())
+
+        def crash():
+            raise RuntimeError("benchmark crash")
+        setattr(de_emailer, 'email_write_back' if self.running_mode in ('2', '3') else 'run_close', crash)
+        try:
+            de_emailer.process_manager()
+        except RuntimeError:
+            pass
+        finally:
+            de_emailer.connections_close()
+
+    # Checks the end state of every child ticket and collects the counts from the fake backends and the stage timings
+    # of the run summary
+    #
+    def result(self, elapsed, summary):
+        child_keys = ["CAM-{}".format(self.tickets + i) for i in range(1, self.tickets + 1)]
+        posted = sum(1 for key in child_keys if self.jira.fields(key)['status']['name'] == 'Complete'
+                     and self.jira.fields(key)['duedate']
+                     and any(name == 'ftp_time_stamp.txt' for name, _, _ in self.jira.attachments[key]))
+        emailed = sum(1 for key in child_keys if 'Email_Sent' in self.jira.fields(key)['labels'])
+        expected_posted = self.tickets if self.running_mode in ('1', '3') else 0
+        expected_emailed = self.tickets if self.running_mode in ('2', '3') else 0
+        # a run that finished leaves no ticket in the run journal
+        journal_file = os.path.join(self.work_dir, 'run_journal.jsonl')
+        journal_entries = 0
+        if os.path.isfile(journal_file):
+            with open(journal_file, 'r') as file:
+                journal_entries = sum(1 for _ in file)
+        return {
+            "tickets":              self.tickets,
+            "running_mode":         self.running_mode,
+            "engine":               self.engine,
+            "elapsed_seconds":      round(elapsed, 3),
+            "tickets_per_second":   round(self.tickets / elapsed, 2) if elapsed else None,
+            "posted":               posted,
+            "emailed":              emailed,
+            "emails_received":      len(self.smtp.messages),
+            "journal_entries":      journal_entries,
+            "ok":                   (posted >= expected_posted and emailed == expected_emailed
+                                     and len(self.smtp.messages) == expected_emailed and not journal_entries),
+            "jira_requests":        dict(self.jira.request_counts),
+            "smtp_connections":     self.smtp.connections,
+            "sftp_connections":     self.sftp.connections if self.sftp is not None else 0,
+            "sftp_operations":      self.sftp.operations if self.sftp is not None else 0,
+            "sftp_bytes_written":   self.sftp.bytes_written if self.sftp is not None else 0,
+            "stages":               {name: {"count": stage["count"], "p50": stage["p50"], "p95": stage["p95"]}
+                                     for name, stage in summary["stages"].items()}
+        }
+
+    # Stops the fake backends and removes the work directory
+    #
+    def teardown(self):
+        for backend in (self.jira, self.smtp, self.sftp):
+            if backend is not None:
+                backend.stop()
+        if self.work_dir is not None and not self.keep:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+# Runs the benchmark the requested number of times, each run on a fresh set of tickets and backends, and prints the
+# per-run results with the median and spread of the run times
+#
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the Weekly Email Process on fake backends")
+    parser.add_argument('--tickets', type=int, default=20)
+    parser.add_argument('--zip-size', type=int, default=1048576, help="bytes per zip file")
+    parser.add_argument('--mode', default='3', choices=['1', '2', '3'], help="running mode")
+    parser.add_argument('--engine', default='threads', choices=['threads', 'asyncio'])
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--sftp-connections', type=int, default=4)
+    parser.add_argument('--jira-latency', type=float, default=0.0, help="seconds added to every Jira request")
+    parser.add_argument('--smtp-latency', type=float, default=0.0, help="seconds added to every email")
+    parser.add_argument('--sftp-latency', type=float, default=0.0, help="seconds added to every sftp operation")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help="keep the work directory of each run")
+    parser.add_argument('--log-file', default='', help="write the process log to this file")
+    parser.add_argument('--crash-rerun', action='store_true',
+                        help="crash a first run before its end and time the rerun resuming from the run journal")
+    parser.add_argument('--json', action='store_true', help="print the results as json")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(filename=args.log_file or None, level=logging.INFO if args.log_file else logging.CRITICAL,
+                        format='%(asctime)s: %(levelname)-7s: %(name)-30s: %(threadName)-12s: %(message)s')
+
+    results = []
+    for run in range(args.repeat):
+        harness = BenchmarkHarness(args.tickets, args.zip_size, args.mode, args.engine, args.max_workers,
+                                   args.sftp_connections, args.jira_latency, args.smtp_latency, args.sftp_latency,
+                                   args.seed + run, args.keep, args.crash_rerun)
+        results.append(harness.run())
+
+    run_times = [result["elapsed_seconds"] for result in results]
+    summary = {
+        "started":          datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "runs":             results,
+        "median_seconds":   round(statistics.median(run_times), 3),
+        "min_seconds":      min(run_times),
+        "max_seconds":      max(run_times),
+        "all_ok":           all(result["ok"] for result in results)
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for run, result in enumerate(results, 1):
+            print("run {}: {:>8.3f}s  {:>7} tickets/s  posted {}/{}  emailed {}/{}  jira requests {}  {}".format(
+                run, result["elapsed_seconds"], result["tickets_per_second"], result["posted"], result["tickets"],
+                result["emailed"], result["tickets"], sum(result["jira_requests"].values()),
+                "ok" if result["ok"] else "INCOMPLETE"))
+        print("median {:.3f}s  min {:.3f}s  max {:.3f}s".format(summary["median_seconds"], summary["min_seconds"],
+                                                                summary["max_seconds"]))
+    return 0 if summary["all_ok"] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
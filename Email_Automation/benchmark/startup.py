@@ -0,0 +1,115 @@
+# startup module
+# Module holds the functions that measure the cold start of the Weekly Email Process
+# Runs each running mode in a fresh interpreter and measures the process wall time, the import time of the Data
+# Enablement Email Manager, the time to create it and the time of a first run against the fake backends, and reports
+# the heavy libraries (jira, pysftp/paramiko, openpyxl, ...) loaded by the import and by the run
+#
+# Run from the Email_Automation directory, e.g. -> python -m benchmark.startup --repeat 5
+#
+import subprocess
+import argparse
+import statistics
+import time
+import json
+import sys
+import os
+import logging
+
+# the libraries whose import cost is tracked, by the top level module name
+HEAVY_MODULES = ('jira', 'requests_toolbelt', 'openpyxl', 'pysftp', 'paramiko', 'multiprocessing_logging', 'asyncio')
+
+
+# Returns the tracked libraries loaded in the interpreter
+#
+def heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+# Measures a single cold start in this interpreter and prints it as json, run by main in a fresh interpreter per sample
+#
+def child(running_mode, engine, tickets):
+    logging.basicConfig(level=logging.CRITICAL)
+    start = time.perf_counter()
+    from data_enablement_email_manager import DataEnablementEmailManager
+    import_seconds = time.perf_counter() - start
+    import_modules = heavy_modules()
+
+    from benchmark.harness import BenchmarkHarness
+    harness = BenchmarkHarness(tickets, zip_size=1024, running_mode=running_mode, engine=engine)
+    harness.setup()
+    try:
+        # the libraries loaded by the harness itself (openpyxl for the workbook, paramiko for the sFTP server) are not
+        # counted as loaded by the run
+        setup_modules = set(heavy_modules())
+        start = time.perf_counter()
+        de_emailer = DataEnablementEmailManager(harness.config_params())
+        construct_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        de_emailer.process_manager()
+        run_seconds = time.perf_counter() - start
+        run_modules = [name for name in heavy_modules() if name not in setup_modules]
+    finally:
+        harness.teardown()
+
+    print(json.dumps({
+        "import_seconds":       round(import_seconds, 4),
+        "construct_seconds":    round(construct_seconds, 4),
+        "run_seconds":          round(run_seconds, 4),
+        "import_modules":       import_modules,
+        "run_modules":          run_modules
+    }))
+
+
+# Runs the cold start of a running mode in a fresh interpreter, returns its measures with the process wall time
+#
+def sample(running_mode, engine, tickets):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-m', 'benchmark.startup', '--child', '--mode',
+                             running_mode, '--engine', engine, '--tickets', str(tickets)],
+                            stdout=subprocess.PIPE, check=True, cwd=os.path.dirname(os.path.dirname(__file__)) or '.')
+    result = json.loads(output.stdout.decode().strip().splitlines()[-1])
+    result["process_seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+# Measures the cold start of each requested running mode the requested number of times and prints the medians with
+# the heavy libraries loaded
+#
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the Weekly Email Process")
+    parser.add_argument('--mode', default='', choices=['', '1', '2', '3'], help="running mode (default: all)")
+    parser.add_argument('--engine', default='threads', choices=['threads', 'asyncio'])
+    parser.add_argument('--tickets', type=int, default=1, help="tickets of the first run")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="print the results as json")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.mode, args.engine, args.tickets)
+        return 0
+
+    results = {}
+    for running_mode in ([args.mode] if args.mode else ['1', '2', '3']):
+        samples = [sample(running_mode, args.engine, args.tickets) for _ in range(args.repeat)]
+        results[running_mode] = {
+            measure: round(statistics.median(result[measure] for result in samples), 4)
+            for measure in ("process_seconds", "import_seconds", "construct_seconds", "run_seconds")
+        }
+        results[running_mode]["import_modules"] = samples[-1]["import_modules"]
+        results[running_mode]["run_modules"] = samples[-1]["run_modules"]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for running_mode, result in results.items():
+            print("mode {}: process {:.3f}s  import {:.3f}s  construct {:.4f}s  first run {:.3f}s".format(
+                running_mode, result["process_seconds"], result["import_seconds"], result["construct_seconds"],
+                result["run_seconds"]))
+            print("        loaded by the import: {}  by the run: {}".format(
+                ", ".join(result["import_modules"]) or "-", ", ".join(result["run_modules"]) or "-"))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -5,14 +5,20 @@
 from datetime import datetime, timedelta
 import time
 import os
+import threading
 from multiprocessing.dummy import Pool as ThreadPool
-from multiprocessing_logging import install_mp_handler
 import logging
 
-from jira_manager import JiraManager
-from sftp_manager import sFTPManager
-from email_manager import EmailManager
+# jira_manager (jira), sftp_manager (pysftp, paramiko), async_engine (asyncio) and multiprocessing_logging are imported
+# by the stage that first needs them, so a run only loads the libraries of its running mode and engine
+from email_manager import EmailManager, SMTPSession
 from excel_manager import ExcelManager
+from delivery_manifest import DeliveryManifest
+from run_metrics import RunMetrics
+from metrics_exporter import MetricsExporter
+from run_journal import RunJournal
+from discovery_watermark import DiscoveryWatermark
+from receipt_attachment import ReceiptAttachment
 
 
 today_date = (datetime.now() - timedelta(hours=7)).strftime('%Y%m%d')
@@ -22,210 +28,561 @@ class DataEnablementEmailManager(object):
     def __init__(self, config_params):
         self.email_file_name = config_params['email_file_name']
         self.running_mode = config_params['running_mode']
+        self.max_workers = config_params['max_workers']
+        self.task_timeout = config_params['task_timeout']
+        # socket timeout of every Jira, sFTP and smtp call, a hung call fails its ticket rather than outliving the task
+        # timeout
+        self.io_timeout = config_params['io_timeout'] or None
+        self.engine = config_params['engine']
+        self.async_jira_limit = config_params['async_jira_limit']
         self.sftp_server = config_params['sftp_server']
         self.jira_url = config_params['jira_url']
         self.jira_token = config_params['jira_token']
-        self.jira_pars = JiraManager(self.jira_url, self.jira_token, self.email_file_name)
+        # stage timings, bytes and retries of the run, summarized when the run ends
+        self.metrics = RunMetrics()
+        self.metrics_file = config_params['metrics_file']
+        self.metrics_textfile = config_params['metrics_textfile']
+        # the Jira Manager, and with it the Jira session, is created by the first stage that calls Jira
+        self.jira_manager = None
+        self.jira_lock = threading.Lock()
         self.jira_status_parent = config_params['jql_status_parent']
         self.jira_status_child_sftp = config_params['jql_status_child_sftp']
         self.jira_status_child_email = config_params['jql_status_child_email']
+        self.jira_status_poll_interval = config_params['jira_status_poll_interval']
+        self.jira_status_poll_timeout = config_params['jira_status_poll_timeout']
         self.jira_issuetype = config_params['jql_issuetype']
         self.jira_label = config_params['jql_label']
         self.jira_text = config_params['jql_text']
+        self.jira_discovery_cache_file = config_params['jira_discovery_cache_file']
+        self.jira_discovery_overlap = config_params['jira_discovery_overlap']
+        self.jira_discovery_rescan_days = config_params['jira_discovery_rescan_days']
+        self.jira_full_rescan = config_params['jira_full_rescan']
+        # private key text, or a function returning it (the process secret cache reading Vault)
         self.ssh_key = config_params['ssh_key']
+        self.private_key = None
+        self.private_key_text = None
         self.sftp_url = config_params['sftp_url']
+        self.sftp_port = config_params['sftp_port']
+        self.sftp_known_hosts = config_params['sftp_known_hosts']
         self.sftp_user = config_params['sftp_user']
-        self.sftp_path_to_keyfile = config_params['sftp_path_to_keyfile']
-        self.key_file = self.sftp_path_to_keyfile + "ssh_key_file"
         self.sftp_folder_path = config_params['sftp_folder_path']
+        self.sftp_max_connections = config_params['sftp_max_connections']
+        self.sftp_resume_uploads = config_params['sftp_resume_uploads']
+        self.sftp_chunk_size = config_params['sftp_chunk_size']
+        self.sftp_manifest_file = config_params['sftp_manifest_file']
         self.sftp_zip_file_path = config_params['sftp_zip_file_path']
         self.excel_path = config_params['excel_path']
+        self.excel_cache_file = config_params['excel_cache_file']
         self.email_subject = config_params['email_subject']
         self.email_to = config_params['email_to']
         self.email_from = config_params['email_from']
         self.email_cc = config_params['email_cc']
+        self.email_mail_host = config_params['email_mail_host']
+        self.email_mail_port = config_params['email_mail_port']
+        self.journal_file = config_params['journal_file']
+        # the service mode keeps the Jira session, sFTP and smtp connections open between runs
+        self.keep_warm = config_params['keep_warm']
         self.parent_tickets = []
         self.good_parent_tickets = []
+        self.sftp_child_tickets = {}
+        self.email_child_tickets = {}
         self.run_sftp = ['1', '3']
         self.run_email = ['2', '3']
         self.sftper = None
-        self.ftp_files_attr = []
+        self.manifest = None
+        self.journal = None
+        self.smtp_session = None
+        self.email_write_backs = []
+        # the 'Due' dates of the tickets posted by a run that also emails, written with the email's field update
+        self.due_date_write_backs = {}
+        self.write_back_lock = threading.Lock()
+        self.excel_data = ExcelManager()
         self.logger = logging.getLogger(__name__)
 
     # Manages the process for finding tickets, mines excel data file for license information then launches the
     # subprocess routine to run tickets concurrently
     #
     def process_manager(self):
+        # read the stages completed by earlier runs, a run that crashed is resumed ticket by ticket
+        self.journal_open()
+
+        # the asyncio engine runs the same process with every ticket as a coroutine
+        if self.engine == 'asyncio':
+            from async_engine import AsyncEngine
+            AsyncEngine(self, self.async_jira_limit).run()
+            self.run_close()
+            return
+
         # pulls desired tickets running jql
-        self.parent_tickets = self.jira_pars.find_parent_tickets(self.jira_issuetype, self.jira_status_parent,
-                                                                 self.jira_text)
+        with self.metrics.stage("run.discovery"):
+            self.parent_tickets = self.parent_tickets_find()
+        self.metrics.count("tickets_found", len(self.parent_tickets))
         self.logger.info("{} ticket(s) were found.".format(len(self.parent_tickets)))
         self.logger.info(str([ticket.key for ticket in self.parent_tickets]) + "\n")
 
         # verifies that parent tickets were found that match the search criteria and logs count and a list of all
         # tickets then pulls issue information
         if self.parent_tickets:
-            for parent_ticket in self.parent_tickets:
-                self.logger.info("\n\t\t\t\t\t\t\t  => Parent Ticket Number: {}".format(parent_ticket))
-
-                # fetches the relevant parent ticket level information for email population
-                parent_ticket.customer_name = self.jira_pars.parent_information_pull(parent_ticket)
-                self.logger.info("\t  => Account/Customer name: {}".format(parent_ticket.customer_name))
-
-                # retrieves parent level account information from ZFS1 located excel file for email population
-                try:
-                    account_data = self.excel_data_fetch(parent_ticket)
-                    self.logger.info("\t  => Account/Customer data: {}".format(account_data))
-                except Exception as e:
-                    self.logger.error("Excel data fetch failed => {} - Moving on to next parent ticket".format(e))
-                else:
-                    # create the iterable list for concurrent processing
-                    self.good_parent_tickets.append([parent_ticket, parent_ticket.customer_name, account_data])
+            # reads the account file from ZFS1 once for the run, ticket lookups are then served from the index
+            with self.metrics.stage("run.excel_index"):
+                self.excel_index_build()
+
+            # fetches the parent ticket level information and account data for all parent tickets concurrently, the
+            # parent tickets that fail are dropped
+            with self.metrics.stage("run.enrichment"):
+                enrichment = self.concurrency_manager('enrichment', self.parent_enrichment, self.parent_tickets)
+            self.good_parent_tickets = [ticket["result"] for ticket in enrichment
+                                        if ticket["status"] == "ok" and ticket["result"] is not None]
             self.logger.info("\n")
 
-            # run the ftp automation
+            # open the ftp connection and pull the sub-tasks for ftp posting
             if self.running_mode in self.run_sftp:
-                # create a ssh private-key file on server and copy the key into it, if no file creation - exit
-                try:
-                    self.ssh_key_file_create()
-                except Exception as e:
-                    self.logger.error(
-                        "There was a problem creating the key file: {} on the server: {}".format(self.key_file, e))
-                    raise SystemExit
-                else:
-                    # create the sftp object instance
-                    self.sftper = sFTPManager(self.sftp_url, self.sftp_user, self.key_file,
-                                              self.sftp_folder_path)
-
-                    # open a connection to the ftp server and switch to the assigned directory, if no connection - exit
-                    try:
-                        self.sftper.open_connection()
-                        # remove the private-key file from the server
-                        self.ssh_key_file_remove()
-                    except Exception as e:
-                        self.logger.error(
-                            "There was a problem connecting to the sFTP server: {} - {}".format(e, self.sftp_url))
-                        raise SystemExit
-                    else:
-                        for ticket in self.good_parent_tickets:
-                            self.ftp_manager(ticket)
-                        self.logger.info("\n")
-                        self.sftper.close_connection()
-                        self.logger.info("\n")
+                with self.metrics.stage("run.sftp_connect"):
+                    self.sftp_connect()
+                # pulls desired sub-tasks for all parent tickets running a single jql for ftp posting
+                self.sftp_child_tickets = self.child_tickets_pull(self.jira_status_child_sftp)
             else:
                 self.logger.info("\n")
                 self.logger.info("\t***This run was specified to omit ftp posting.***\n")
 
-            # pause between processes to ensure Jira ticket updating
-            time.sleep(10)
-
-            # run the email automation
+            # pull the sub-tasks already posted that are still waiting on an email
             if self.running_mode in self.run_email:
-                # launch the email concurrency manager
-                self.concurrency_manager('email', self.mail_manager)
+                # all the emails of the run are sent over one shared smtp connection
+                self.smtp_session = self.smtp_session_create()
+                # pulls desired sub-tasks for all parent tickets running a single jql for email delivery
+                self.email_child_tickets = self.child_tickets_pull(self.jira_status_child_email)
             else:
                 self.logger.info("\n")
                 self.logger.info("\t***This run was specified to omit email sending.***\n")
 
+            with self.metrics.stage("run.tickets"):
+                # run the ftp and email automation, each ticket moves on to its email once its own posting is
+                # confirmed
+                if self.running_mode in self.run_sftp and self.running_mode in self.run_email:
+                    self.concurrency_manager('sftp and email', self.pipeline_manager)
+                # run the ftp automation
+                elif self.running_mode in self.run_sftp:
+                    # launch the ftp concurrency manager, uploads run in parallel over the sFTP connection pool
+                    self.concurrency_manager('sftp', self.ftp_manager)
+                # run the email automation
+                elif self.running_mode in self.run_email:
+                    # launch the email concurrency manager
+                    self.concurrency_manager('email', self.mail_manager)
+
+            # write the Jira updates for the emails sent
+            with self.metrics.stage("run.email_write_back"):
+                self.email_write_back()
+
         else:
             self.logger.warning("There were no tickets found with the required criteria to report on.")
 
-        self.jira_pars.kill_session()
+        self.run_close()
 
-    # Finds the associated child ticket, collects date range via Jira, creates zip file name and location information,
-    # calls function for ftp zip file transfer, calls function for email creation and delivery
+    # Ends the run, the connections are closed unless the service mode keeps them warm for its next run
+    #
+    def run_close(self):
+        if not self.keep_warm:
+            self.connections_close()
+        self.journal_close()
+
+    # Closes the sFTP and smtp connections and ends the Jira session
     #
-    def concurrency_manager(self, function_type, function_call):
-        # runs the concurrency for either ftp or email
+    def connections_close(self):
+        if self.sftper is not None:
+            self.sftper.close_connection()
+            self.sftper = None
+            self.logger.info("\n")
+        if self.smtp_session is not None:
+            self.smtp_session.close()
+            self.smtp_session = None
+        if self.jira_manager is not None:
+            self.jira_manager.kill_session()
+
+    # Clears the state of the last run before the service mode starts a new one, the connections and the account index
+    # are kept
+    #
+    def run_reset(self):
+        self.metrics.reset()
+        if self.jira_manager is not None:
+            self.jira_manager.cache_clear()
+        self.parent_tickets = []
+        self.good_parent_tickets = []
+        self.sftp_child_tickets = {}
+        self.email_child_tickets = {}
+        with self.write_back_lock:
+            self.email_write_backs = []
+            self.due_date_write_backs = {}
+
+    # Reads the ssh private key into memory, creates the sFTP Manager instance and opens the connection, exits the run
+    # on failure
+    #
+    def sftp_connect(self):
+        # the connections kept warm by the service mode are reused while all of them are still active
+        if self.sftper is not None:
+            if self.sftper.connections_active():
+                self.logger.info("Reusing the {} open connection(s) to the sFTP server: {}"
+                                 .format(self.sftper.open_count, self.sftp_url))
+                return
+            self.sftper.close_connection()
+            self.sftper = None
+
+        # read the ssh private key into memory, if the key can't be read - exit
+        try:
+            private_key = self.private_key_load()
+        except Exception as e:
+            self.logger.error("There was a problem reading the ssh private key: {}".format(e))
+            raise SystemExit
+
+        # read the record of zip files already delivered, consulted before each upload
+        if self.sftp_manifest_file:
+            try:
+                self.manifest = DeliveryManifest(self.sftp_manifest_file)
+            except Exception as e:
+                self.logger.warning("The delivery manifest: {} could not be read - {}"
+                                    .format(self.sftp_manifest_file, e))
+
+        # create the sftp object instance
+        from sftp_manager import sFTPManager
+        self.sftper = sFTPManager(self.sftp_url, self.sftp_user, private_key, self.sftp_folder_path,
+                                  self.sftp_max_connections, self.sftp_resume_uploads, self.sftp_chunk_size,
+                                  self.sftp_port, self.sftp_known_hosts, self.metrics, self.io_timeout)
+
+        # open a connection to the ftp server and switch to the assigned directory, if no connection - exit
+        try:
+            self.sftper.open_connection()
+        except Exception as e:
+            self.logger.error(
+                "There was a problem connecting to the sFTP server: {} - {}".format(e, self.sftp_url))
+            raise SystemExit
+
+    # Returns the Jira Manager, created on first use so the jira library is imported, and the Jira session opened, only
+    # when a stage calls Jira
+    #
+    @property
+    def jira_pars(self):
+        if self.jira_manager is None:
+            with self.jira_lock:
+                if self.jira_manager is None:
+                    from jira_manager import JiraManager
+                    self.jira_manager = JiraManager(self.jira_url, self.jira_token, self.email_file_name,
+                                                    self.metrics, self.io_timeout)
+        return self.jira_manager
+
+    # Runs the ticket level function over the good parent tickets, or the tickets given, on a bounded pool of worker
+    # threads, each ticket is given the task timeout from the moment it starts (a ticket past it is reported, then
+    # waited on), returns the per-ticket results and exceptions in ticket order
+    #
+    def concurrency_manager(self, function_type, function_call, tickets=None):
+        if tickets is None:
+            tickets = self.good_parent_tickets
+        if not tickets:
+            self.logger.info("=> There are no tickets for the ticket level - {} processing.".format(function_type))
+            return []
+
+        # runs the concurrency for either ftp, email or both
         self.logger.info("=> Beginning the ticket level - {} concurrent processing.".format(function_type))
 
         # activate concurrency logging handler
+        from multiprocessing_logging import install_mp_handler
         install_mp_handler(logger=self.logger)
         # set the logging level of urllib3 to "ERROR" to filter out 'warning level' logging message deluge
         logging.getLogger("urllib3").setLevel(logging.ERROR)
 
-        # launches a thread for each of the found tickets
-        with ThreadPool(processes=len(self.good_parent_tickets)) as ticket_pool:
+        # launches the tickets on at most the configured number of threads
+        start_times = {}
+        results = []
+        ticket_pool = ThreadPool(processes=max(1, min(self.max_workers, len(tickets))))
+        tasks = [(ticket, ticket_pool.apply_async(self.timed_task, (function_call, ticket, start_times)))
+                 for ticket in tickets]
+        for ticket, task in tasks:
+            ticket_key = self.ticket_key(ticket)
+            self.task_wait(task, id(ticket), start_times)
+            if not task.ready():
+                self.logger.error("Ticket Level - {} for Parent Ticket: {} did not finish within {} second(s), its "
+                                  "ftp posting or email may still complete".format(function_type, ticket_key,
+                                                                                   self.task_timeout))
+                results.append({"ticket": ticket_key, "status": "timeout", "result": None, "error": None})
+                continue
             try:
-                ticket_pool.map(function_call, self.good_parent_tickets)
-                ticket_pool.close()
-                ticket_pool.join()
+                result = task.get()
             except Exception as e:
-                self.logger.error = ("Ticket Level - {} Concurrency run failed => {}".format(function_type, e))
+                self.logger.error("Ticket Level - {} for Parent Ticket: {} failed => {}"
+                                  .format(function_type, ticket_key, e))
+                results.append({"ticket": ticket_key, "status": "failed", "result": None, "error": e})
             else:
-                self.logger.info("=> Finished the ticket level - {} concurrent processing.\n".format(function_type))
+                results.append({"ticket": ticket_key, "status": "ok", "result": result, "error": None})
+
+        ticket_pool.close()
+        # a timeout only reports the overrun, the tickets still running are waited on so their Jira updates are queued
+        # before the write-back and the sFTP and smtp connections stay open until they finish
+        timed_out = [result["ticket"] for result in results if result["status"] == "timeout"]
+        if timed_out:
+            self.logger.warning("Waiting on {} timed out ticket(s) to finish, a timed out ticket may still have sent "
+                                "its email => {}".format(len(timed_out), ", ".join(timed_out)))
+        ticket_pool.join()
+
+        self.logger.info("=> Finished the ticket level - {} concurrent processing: {} ok, {} failed, {} timed out.\n"
+                         .format(function_type, *[sum(1 for result in results if result["status"] == status)
+                                                  for status in ("ok", "failed", "timeout")]))
+        return results
+
+    # Returns the parent ticket key of a good parent ticket entry or a parent ticket
+    #
+    @staticmethod
+    def ticket_key(ticket):
+        return ticket[0].key if isinstance(ticket, list) else ticket.key
+
+    # Records the start time of the ticket task then runs it
+    #
+    @staticmethod
+    def timed_task(function_call, ticket, start_times):
+        start_times[id(ticket)] = time.time()
+        return function_call(ticket)
+
+    # Waits on the ticket task until it finishes or its timeout, counted from its start, has passed
+    #
+    def task_wait(self, task, task_id, start_times):
+        if not self.task_timeout:
+            task.wait()
+            return
+        while not task.ready():
+            start_time = start_times.get(task_id)
+            if start_time is None:
+                # still queued behind the other tickets
+                task.wait(1)
+                continue
+            remaining = start_time + self.task_timeout - time.time()
+            if remaining <= 0:
+                return
+            task.wait(remaining)
+
+    # Fetches the relevant parent ticket level information and the account data from the account index for email
+    # population, returns the entry for concurrent processing or None if the parent ticket is dropped
+    #
+    def parent_enrichment(self, parent_ticket):
+        with self.metrics.stage("ticket.enrichment", parent_ticket.key):
+            # a parent ticket enriched by a run that didn't finish takes its customer name and account data from the
+            # journal
+            enriched = self.journal_completed(parent_ticket.key, 'enriched')
+            if enriched is not None:
+                parent_ticket.customer_name = enriched["customer_name"]
+                return [parent_ticket, parent_ticket.customer_name, enriched["account_data"]]
+
+            parent_ticket.customer_name = self.jira_pars.parent_information_pull(parent_ticket)
+            try:
+                account_data = self.excel_data_fetch(parent_ticket)
+            except Exception as e:
+                self.logger.error("Parent Ticket: {}, Excel data fetch failed => {} - Moving on to next parent ticket"
+                                  .format(parent_ticket.key, e))
+                self.metrics.count("tickets_failed")
+                return None
+            self.journal_record(parent_ticket.key, 'enriched', customer_name=parent_ticket.customer_name,
+                                account_data=account_data)
+            self.logger.info("\t  => Parent Ticket: {}, Account/Customer name: {}, Account/Customer data: {}"
+                             .format(parent_ticket.key, parent_ticket.customer_name, account_data))
+            return [parent_ticket, parent_ticket.customer_name, account_data]
+
+    # Runs the ftp posting for the parent ticket then, as soon as the child ticket has been confirmed as progressed,
+    # the email for that child ticket; without a posted child ticket the email falls back to any child already posted
+    #
+    def pipeline_manager(self, parent_ticket):
+        # a failed ftp posting still falls through to the email of a child ticket already posted
+        try:
+            child_ticket_email = self.ftp_manager(parent_ticket)
+        except Exception as e:
+            self.logger.error("Parent Ticket: {}, the ftp posting failed => {}".format(parent_ticket[0].key, e))
+            self.metrics.count("tickets_failed")
+            child_ticket_email = None
+        self.mail_manager(parent_ticket, child_ticket_email)
 
     # Finds the associated child ticket, collects date range via Jira, creates zip file name and location information,
-    # calls function for ftp zip file transfer
+    # calls function for ftp zip file transfer, returns the child ticket once its progress to 'Complete' is confirmed,
+    # the steps are shared with the asyncio engine which runs each on its backend's executor slot
     #
     def ftp_manager(self, parent_ticket):
-        # pulls desired sub-tasks running jql for ftp posting
-        child_ticket_sftp = self.child_ticket_pull(parent_ticket[0], self.jira_status_child_sftp)
-
-        # post zip files to customer ftp site
-        if child_ticket_sftp is not None:
+        with self.metrics.stage("ticket.sftp", parent_ticket[0].key):
+            sftp_ticket = self.sftp_ticket_info(parent_ticket)
+            if sftp_ticket is None:
+                return None
+            child_ticket_sftp, zip_file_zfs_path, zip_file_name = sftp_ticket
+
+            ftp_file = self.sftp_ticket_post(child_ticket_sftp, zip_file_zfs_path, zip_file_name)
+            if ftp_file is None:
+                return None
+
+            outcome = self.ticket_modifier_sftp(child_ticket_sftp, ftp_file, zip_file_name)
+            if not self.sftp_ticket_transitioned(outcome):
+                return self.sftp_ticket_confirm(child_ticket_sftp, False)
+            # confirm the ticket progress by its status rather than waiting a fixed time
+            with self.metrics.stage("ticket.sftp_status_wait"):
+                progressed = self.jira_pars.wait_for_status(child_ticket_sftp, self.jira_status_child_email,
+                                                            self.jira_status_poll_timeout,
+                                                            self.jira_status_poll_interval)
+            return self.sftp_ticket_confirm(child_ticket_sftp, progressed)
+
+    # Looks up the desired sub-task found for ftp posting and its zip file path and name, returns them or None if
+    # there is nothing to post
+    #
+    def sftp_ticket_info(self, parent_ticket):
+        child_ticket_sftp = self.sftp_child_tickets.get(parent_ticket[0].key)
+        if child_ticket_sftp is None:
             self.logger.info("\n")
-            self.logger.info("=> Parent Ticket: {}, Child Ticket: {}".format(parent_ticket[0].key,
-                                                                             child_ticket_sftp.key))
+            self.logger.warning("\t  => Parent Ticket: {}, No child ticket found with the required criteria to "
+                                "process.".format(parent_ticket[0].key))
+            return None
+        self.logger.info("\n")
+        self.logger.info("=> Parent Ticket: {}, Child Ticket: {}".format(parent_ticket[0].key, child_ticket_sftp.key))
 
-            zip_file_zfs_path, zip_file_name = self.zip_file_info(parent_ticket[0], child_ticket_sftp)
+        zip_file_info = self.zip_file_info(parent_ticket[0], child_ticket_sftp)
+        if zip_file_info is None:
+            self.metrics.count("tickets_failed")
+            return None
+        return [child_ticket_sftp] + list(zip_file_info)
 
-            try:
-                ftp_file = self.file_sftp(zip_file_zfs_path, zip_file_name)
-            except Exception as e:
-                self.logger.error("There was a problem with the ftp execution -> {}".format(e))
-            else:
-                if ftp_file is not None:
-                    self.ticket_modifier_sftp(child_ticket_sftp, ftp_file, zip_file_name)
-                else:
-                    self.logger.error("The presence of the zip file on the ftp site could not be confirmed")
+    # Posts the zip file to the customer ftp site, returns the receipt attachment or None if the posting failed
+    #
+    def sftp_ticket_post(self, child_ticket_sftp, zip_file_zfs_path, zip_file_name):
+        try:
+            ftp_file = self.file_sftp(zip_file_zfs_path, zip_file_name, child_ticket_sftp.key)
+        except Exception as e:
+            self.logger.error("There was a problem with the ftp execution -> {}".format(e))
+            ftp_file = None
         else:
-            self.logger.info("\n")
-            self.logger.warning("\t  => Parent Ticket: {}, No child ticket found with the required criteria to process."
-                                .format(parent_ticket[0].key))
+            if ftp_file is None:
+                self.logger.error("The presence of the zip file on the ftp site could not be confirmed")
+        if ftp_file is None:
+            self.metrics.count("tickets_failed")
+        return ftp_file
+
+    # Returns whether the transition to 'Complete' was written by the posting update (or by an earlier run), a ticket
+    # whose transition failed even after its retry can't reach the status and is not waited on
+    #
+    @staticmethod
+    def sftp_ticket_transitioned(outcome):
+        return outcome is None or outcome["retry"] is None or outcome["retry"]["transition"] is None
+
+    # Counts the posting once the child ticket's progress is known, returns the child ticket if it has progressed
+    #
+    def sftp_ticket_confirm(self, child_ticket_sftp, progressed):
+        if progressed:
+            self.metrics.count("tickets_posted")
+            return child_ticket_sftp
+        self.logger.error("The progress of Jira Ticket: {} to status: {} could not be confirmed"
+                          .format(child_ticket_sftp.key, self.jira_status_child_email))
+        self.metrics.count("tickets_failed")
+        return None
 
     # Finds the associated child ticket, collects date range via Jira, creates zip file name and location information,
-    # calls function for email creation and delivery
+    # calls function for email creation and delivery, the steps are shared with the asyncio engine
+    #
+    def mail_manager(self, parent_ticket, child_ticket_email=None):
+        with self.metrics.stage("ticket.email", parent_ticket[0].key):
+            child_ticket_email = self.email_ticket_info(parent_ticket, child_ticket_email)
+            if child_ticket_email is None:
+                return
+            email_file = self.email_ticket_send(parent_ticket, child_ticket_email)
+            if email_file is not None:
+                self.email_ticket_record(child_ticket_email, email_file)
+
+    # Looks up the desired sub-task found for email delivery, unless handed the child ticket just posted, and its date
+    # range, returns it or None if there is no email left to send
     #
-    def mail_manager(self, parent_ticket):
-        # Pulls desired sub-tasks running jql for email delivery
-        child_ticket_email = self.child_ticket_pull(parent_ticket[0], self.jira_status_child_email)
+    def email_ticket_info(self, parent_ticket, child_ticket_email=None):
+        if child_ticket_email is None:
+            child_ticket_email = self.email_child_tickets.get(parent_ticket[0].key)
+        if child_ticket_email is None:
+            self.logger.warning("Parent Ticket: {}, There was no child ticket found with the required criteria to "
+                                "process.".format(parent_ticket[0].key))
+            return None
+        self.logger.info("=> Parent Ticket: {}, Child Ticket: {}".format(parent_ticket[0].key, child_ticket_email.key))
 
-        # send email to customer about zip file delivery
-        if child_ticket_email is not None:
-            self.logger.info("=> Parent Ticket: {}, Child Ticket: {}".format(parent_ticket[0].key,
-                                                                             child_ticket_email.key))
+        if self.email_resume(child_ticket_email):
+            return None
+        child_ticket_email.date_range = self.jira_pars.child_information_pull(child_ticket_email)
+        return child_ticket_email
 
-            child_ticket_email.date_range = self.jira_pars.child_information_pull(child_ticket_email)
+    # Sends the email to customer about zip file delivery, returns the email copy or None if the sending failed
+    #
+    def email_ticket_send(self, parent_ticket, child_ticket_email):
+        try:
+            return self.emailer(parent_ticket[1], child_ticket_email.date_range, parent_ticket[2])
+        except Exception as e:
+            self.logger.error("There was a problem sending the email -> {}".format(e))
+            self.metrics.count("tickets_failed")
+            return None
 
-            try:
-                email_file = self.emailer(parent_ticket[1], child_ticket_email.date_range, parent_ticket[2])
-            except Exception as e:
-                self.logger.error("There was a problem sending the email -> {}".format(e))
-            else:
-                self.ticket_modifier_email(child_ticket_email, email_file)
+    # Records the email sent and queues its Jira updates
+    #
+    def email_ticket_record(self, child_ticket_email, email_file):
+        self.ticket_modifier_email(child_ticket_email, email_file)
+        self.metrics.count("tickets_emailed")
+
+    # Resumes the email of a child ticket from the run journal, an email sent by a run that didn't finish is not sent
+    # again and only its Jira update is queued, returns True if there is nothing left to send
+    #
+    def email_resume(self, child_ticket_email):
+        if self.journal_completed(child_ticket_email.key, 'jira_email_updated') is not None:
+            self.logger.info("The email for this ticket was already sent and posted, moving on.")
+            return True
+        emailed = self.journal_completed(child_ticket_email.key, 'emailed')
+        if emailed is None:
+            return False
+        self.logger.info("The email for this ticket was already sent, only the Jira update is queued.")
+        self.ticket_modifier_email(child_ticket_email, ReceiptAttachment(emailed["email"]))
+        self.metrics.count("tickets_emailed")
+        return True
+
+    # Searches Jira for the parent tickets, incrementally from the watermark of the last run when a discovery cache
+    # file is configured
+    #
+    def parent_tickets_find(self):
+        watermark = None
+        if self.jira_discovery_cache_file:
+            watermark = DiscoveryWatermark(self.jira_discovery_cache_file, self.jira_discovery_overlap,
+                                           self.jira_discovery_rescan_days)
+        return self.jira_pars.find_parent_tickets(self.jira_issuetype, self.jira_status_parent, self.jira_text,
+                                                  watermark, self.jira_full_rescan)
+
+    # Builds the account index from the excel file, a failure leaves the index empty so each parent ticket is dropped
+    #
+    def excel_index_build(self):
+        try:
+            self.excel_data.build_account_index(self.excel_path, self.excel_cache_file)
+        except Exception as e:
+            self.logger.error("There was a problem reading the excel account file: {}".format(e))
         else:
-            self.logger.warning("There was no child ticket found with the required criteria to process.")
+            self.logger.info("{} account(s) were indexed from the excel file: {}\n"
+                             .format(len(self.excel_data.account_index), self.excel_data.account_file_name))
 
-    # Creates the Excel Manager instance and fetches the Parent level account data
+    # Fetches the Parent level account data from the account index
     #
     def excel_data_fetch(self, ticket):
-        excel_data = ExcelManager()
-        customer_identifier = excel_data.excel_search(ticket, self.excel_path)
-        account_data = excel_data.excel_read(customer_identifier)
+        account_data = self.excel_data.account_lookup(ticket)
         return account_data
 
-    # Finds and returns the sub-task ticket associated with the parent ticket
+    # Creates the smtp session shared by all the emails of the run, the session kept warm by the service mode is reused
+    # (it reconnects if the mail host dropped the connection)
     #
-    def child_ticket_pull(self, parent_ticket, jira_status_child):
-        # pulls desired sub-task running jql
+    def smtp_session_create(self):
+        if self.smtp_session is not None:
+            return self.smtp_session
+        return SMTPSession(self.email_mail_host, self.email_mail_port, self.metrics, self.io_timeout)
+
+    # Finds the sub-task tickets associated with all the good parent tickets, returns a map of parent key to child
+    # ticket
+    #
+    def child_tickets_pull(self, jira_status_child):
+        # pulls desired sub-tasks running jql
         try:
-            child_ticket = self.jira_pars.find_child_tickets(parent_ticket, jira_status_child, self.jira_label)
+            child_tickets = self.jira_pars.find_child_tickets_bulk([ticket[0] for ticket in self.good_parent_tickets],
+                                                                   jira_status_child, self.jira_label)
         except Exception as e:
             self.logger.error("There was a problem fetching the child tickets. => {}".format(e))
-            return None
+            return {}
         else:
-            return child_ticket
+            self.logger.info("{} child ticket(s) were found with status: {}".format(len(child_tickets),
+                                                                                   jira_status_child))
+            return child_tickets
 
     # Pulls the date range from ticket, adds this to the parent ticket and child ticket keys to create zip file path
     # and name
@@ -242,76 +599,237 @@ class DataEnablementEmailManager(object):
             zip_file_name = "{}_{}.zip".format(parent_ticket.customer_name, child_ticket.date_range)
             return zip_file_zfs_path, zip_file_name
 
-    # Creates a temporary ssh private-key file on EC2 instance and copies in the key value from the vault
+    # Returns the ssh private key as a paramiko key object held in memory, parsed again only when the key read from the
+    # secret cache has changed (rotated in Vault)
     #
-    def ssh_key_file_create(self):
-        with open(self.key_file, 'w') as file:
-            file.write(self.ssh_key)
-
-    # Removes the temporary ssh private-key file from the EC2 instance
-    #
-    def ssh_key_file_remove(self):
-        os.remove(self.key_file)
+    def private_key_load(self):
+        from sftp_manager import sFTPManager
+        key_text = self.ssh_key() if callable(self.ssh_key) else self.ssh_key
+        if self.private_key is None or key_text != self.private_key_text:
+            self.private_key = sFTPManager.load_private_key(key_text)
+            self.private_key_text = key_text
+        return self.private_key
 
     # Creates a sFTP Manager instance, calls the sftp_put module which uploads zip file to client ftp server, retrieves
     # attributes from ftp site and creates file for jira ticket posting, validating file delivery
     #
-    def file_sftp(self, child_ticket_zfs_path, zip_file_name):
-        # copy zip file from zfs/Technology to designated client ftp site and directory
+    def file_sftp(self, child_ticket_zfs_path, zip_file_name, ticket_key=None):
+        # a posting verified by a run that didn't finish takes its receipt from the journal
+        verified = self.journal_completed(ticket_key, 'verified')
+        if verified is not None:
+            self.logger.info("The zip file {} was already posted and verified, the receipt is taken from the journal"
+                             .format(zip_file_name))
+            return ReceiptAttachment(verified["receipt"])
+
+        # skip the upload if the journal or the delivery manifest shows the zip file is already on the ftp site
+        uploaded = self.journal_completed(ticket_key, 'uploaded')
+        upload = uploaded["upload"] if uploaded is not None else self.manifest_check(child_ticket_zfs_path,
+                                                                                      zip_file_name)
+        if upload is not None:
+            self.logger.info("The zip file {} was already delivered to the {} site, the upload is skipped"
+                             .format(zip_file_name, self.sftp_url))
+        else:
+            # copy zip file from zfs/Technology to designated client ftp site and directory
+            try:
+                upload = self.sftper.sftp_put(child_ticket_zfs_path, zip_file_name)
+            except Exception as e:
+                self.logger.error("There was a problem uploading the file: {} to the ftp site: {}"
+                                  .format(zip_file_name, e))
+                return None
+            else:
+                self.logger.info("The zip file {} has been posted on the {} site".format(zip_file_name, self.sftp_url))
+                self.manifest_record(child_ticket_zfs_path, zip_file_name, upload)
+                self.journal_record(ticket_key, 'uploaded', upload=upload)
+
+        # confirm the posting with a remote stat of the uploaded file, then create the Jira attachment from its
+        # attributes
         try:
-            self.sftper.sftp_put(child_ticket_zfs_path, zip_file_name)
+            ftp_file_attr = self.sftper.verify_upload(zip_file_name)
         except Exception as e:
-            self.logger.error("There was a problem uploading the file: {} to the ftp site: {}".format(zip_file_name, e))
+            self.logger.error("The ftp file: {} could not be found on the server - {}".format(zip_file_name, e))
             return None
-        else:
-            self.logger.info("The zip file {} has been posted on the {} site".format(zip_file_name, self.sftp_url))
 
-        # slight pause to ensure ftp directory has been updated with the file posting, then check for files on server
-        time.sleep(5)
-        self.ftp_files_attr = self.sftper.get_attributes()
-
-        # creates and returns a stringIO file object of that file for Jira attachment
+        # creates and returns the receipt attachment of that file for Jira
         try:
-            attachment_file = self.sftper.create_stringio(zip_file_name, self.ftp_files_attr)
+            attachment_file = self.sftper.create_receipt(ftp_file_attr, upload)
         except Exception as e:
             self.logger.error("There was a problem creating the file attachment for: {} - {}".format(zip_file_name, e))
             return None
         else:
-            #time.sleep(1)
-            #print("{}".format(attachment_file.getvalue()))
-            #time.sleep(1)
+            self.journal_record(ticket_key, 'verified', receipt=attachment_file.text())
             return attachment_file
 
-    # Creates the Email Manager instance, launches the weekly emailer module
+    # Consults the delivery manifest, returns the upload details if the zip file is already on the ftp site or None
+    #
+    def manifest_check(self, child_ticket_zfs_path, zip_file_name):
+        if self.manifest is None:
+            return None
+        try:
+            entry = self.manifest.lookup("{}{}".format(child_ticket_zfs_path, zip_file_name))
+            if entry is None:
+                return None
+            return self.sftper.delivered_upload(zip_file_name, entry)
+        except Exception as e:
+            self.logger.warning("The delivery manifest check failed for: {} - {}".format(zip_file_name, e))
+            return None
+
+    # Records the delivered zip file in the delivery manifest
+    #
+    def manifest_record(self, child_ticket_zfs_path, zip_file_name, upload):
+        if self.manifest is None:
+            return
+        try:
+            self.manifest.record("{}{}".format(child_ticket_zfs_path, zip_file_name),
+                                 "{}{}".format(self.sftp_folder_path, zip_file_name), upload["sha256"])
+        except Exception as e:
+            self.logger.warning("The delivery of: {} could not be recorded in the manifest - {}"
+                                .format(zip_file_name, e))
+
+    # Opens the run journal, the stages completed by a run that didn't finish are read from it
+    #
+    def journal_open(self):
+        if not self.journal_file:
+            return
+        try:
+            self.journal = RunJournal(self.journal_file)
+        except Exception as e:
+            self.logger.warning("The run journal could not be read: {} - every ticket runs from its start - {}"
+                                .format(self.journal_file, e))
+            self.journal = None
+
+    # Compacts the run journal at the end of the run, the tickets that went through the last stage of the running mode
+    # are dropped from it, the Jira posting update when the run omits the email
+    #
+    def journal_close(self):
+        if self.journal is None:
+            return
+        try:
+            final_stage = 'jira_email_updated' if self.running_mode in self.run_email else 'jira_sftp_updated'
+            remaining = self.journal.compact(final_stage)
+            self.logger.info("The run journal holds {} ticket(s) part way through their stages".format(remaining))
+        except Exception as e:
+            self.logger.warning("The run journal could not be compacted: {} - {}".format(self.journal_file, e))
+
+    # Returns the data recorded in the run journal for the completed ticket stage, or None if it has to be run
+    #
+    def journal_completed(self, ticket_key, stage):
+        if self.journal is None or ticket_key is None:
+            return None
+        return self.journal.completed(ticket_key, stage)
+
+    # Records the completed ticket stage in the run journal, a failure to record only costs redoing the stage on resume
+    #
+    def journal_record(self, ticket_key, stage, **data):
+        if self.journal is None or ticket_key is None:
+            return
+        try:
+            self.journal.record(ticket_key, stage, **data)
+        except Exception as e:
+            self.logger.warning("The {} stage of: {} could not be recorded in the run journal - {}"
+                                .format(stage, ticket_key, e))
+
+    # Creates the Email Manager instance, launches the weekly emailer module, raises if the email was not sent
     #
     def emailer(self, customer_name, date_range, account_data):
         weekly_email = EmailManager(date_range, customer_name, account_data, self.email_subject,
                                     self.email_to, self.email_from, self.email_cc, self.sftp_server)
-        email_file = weekly_email.weekly_emailer()
+        email_file = weekly_email.weekly_emailer(self.smtp_session)
+        # the email manager logs a failed send and returns an empty receipt, the ticket is not updated for it
+        if not email_file.size:
+            raise IOError("The email for this ticket was not sent")
         self.logger.info("The email for this ticket has been sent.")
         return email_file
 
-    # Modifies Jira ticket by attaching ftp text file, adding comment and progressing status of ticket to 'Complete'
+    # Modifies Jira ticket by attaching ftp text file, adding comment, setting the 'Due' date and progressing status of
+    # ticket to 'Complete', written straight away as the ticket's email waits on its progress, unless the run journal
+    # shows an earlier run already wrote them, a run that also emails holds the 'Due' date back for the email's field
+    # update so the ticket gets a single one
     #
     def ticket_modifier_sftp(self, ticket, ftp_file, zip_file_name):
-        self.jira_pars.add_ftp_attachment(ticket, ftp_file)
-        self.logger.info("A copy of the ftp posting time-stamp has been attached as a text file to "
-                         "Jira Ticket: {}".format(ticket.key))
-        self.jira_pars.add_ftp_posting_comment(ticket, zip_file_name)
-        self.logger.info("The zip file/ftp posting alert has been added as a comment to "
-                         "Jira Ticket: {}".format(ticket.key))
-        self.jira_pars.update_duedate_field(ticket)
-        self.jira_pars.progress_ticket(ticket)
-
-    # Modifies Jira ticket by attaching email-text file, adding comment and changing the 'labels' field
+        if self.journal_completed(ticket.key, 'jira_sftp_updated') is not None:
+            self.logger.info("Jira Ticket: {} was already updated for the posting".format(ticket.key))
+            return None
+        due_date = self.jira_pars.due_date()
+        plan = self.jira_pars.plan_ftp_posting(self.jira_pars.write_plan(ticket), ftp_file, zip_file_name)
+        if self.running_mode in self.run_email:
+            with self.write_back_lock:
+                self.due_date_write_backs[ticket.key] = (ticket, due_date)
+        else:
+            self.jira_pars.plan_due_date(plan, due_date)
+            due_date = None
+        outcome = self.write_back_report(self.jira_pars.write_back([plan]))[0]
+        if not outcome["errors"]:
+            # the 'Due' date held back is kept so a resumed run still writes it with the email's updates
+            self.journal_record(ticket.key, 'jira_sftp_updated', due_date=due_date)
+        return outcome
+
+    # Modifies Jira ticket by attaching email-text file, adding comment and changing the 'labels' field, the updates
+    # are queued for the email write-back stage at the end of the run, the sent email is recorded in the run journal
     #
     def ticket_modifier_email(self, ticket, email_file):
-        self.jira_pars.add_email_attachment(ticket, email_file)
-        self.logger.info("A copy of the email has been attached as a text file to Jira Ticket: {}".format(ticket.key))
-        self.jira_pars.add_rr_alert_comment(ticket)
-        self.logger.info(
-            "A Revenue Recognition alert has been added as a comment to Jira Ticket: {}".format(ticket.key))
-        self.jira_pars.update_labels_field(ticket)
+        if email_file.size and self.journal_completed(ticket.key, 'emailed') is None:
+            self.journal_record(ticket.key, 'emailed', email=email_file.text())
+        plan = self.jira_pars.plan_email_posting(self.jira_pars.write_plan(ticket), email_file)
+        with self.write_back_lock:
+            due_date = self.due_date_write_backs.pop(ticket.key, (None, None))[1]
+            if due_date is None:
+                due_date = (self.journal_completed(ticket.key, 'jira_sftp_updated') or {}).get('due_date')
+            if due_date is not None:
+                self.jira_pars.plan_due_date(plan, due_date)
+            self.email_write_backs.append(plan)
+
+    # Writes the queued email updates of all the tickets, concurrently across the tickets, with the 'Due' dates held
+    # back for the tickets posted but not emailed by the run
+    #
+    def email_write_back(self):
+        with self.write_back_lock:
+            plans, self.email_write_backs = self.email_write_backs, []
+            due_date_plans = [self.jira_pars.plan_due_date(self.jira_pars.write_plan(ticket), due_date)
+                              for ticket, due_date in self.due_date_write_backs.values()]
+            self.due_date_write_backs = {}
+        if due_date_plans:
+            self.logger.info("=> Writing the 'Due' date to {} Jira ticket(s) posted without an email."
+                             .format(len(due_date_plans)))
+        if plans or due_date_plans:
+            self.logger.info("=> Writing the email updates to {} Jira ticket(s).".format(len(plans)))
+            outcomes = self.write_back_report(self.jira_pars.write_back(plans + due_date_plans))
+            return self.email_write_back_record(outcomes[:len(plans)]) + outcomes[len(plans):]
+        return []
+
+    # Records the completed email updates in the run journal, the tickets still failing are updated again on resume
+    #
+    def email_write_back_record(self, outcomes):
+        for outcome in outcomes:
+            if not outcome["errors"]:
+                self.journal_record(outcome["ticket"], 'jira_email_updated')
+        return outcomes
+
+    # Logs the per-ticket outcomes of a Jira write-back, the updates still failing after retry are listed
+    #
+    def write_back_report(self, outcomes):
+        for outcome in outcomes:
+            if outcome["done"]:
+                self.logger.info("Jira Ticket: {} has been updated => {}".format(outcome["ticket"],
+                                                                               ", ".join(outcome["done"])))
+            for error in outcome["errors"]:
+                self.logger.error("Jira Ticket: {} update failed => {}".format(outcome["ticket"], error))
+        return outcomes
+
+    # Logs the stage timing table of the run and writes the run summary file, returns the summary
+    #
+    def run_summary(self):
+        return self.metrics.report(self.metrics_file)
+
+    # Writes the run metrics to the Prometheus textfile for the node exporter, a failure to write doesn't fail the run
+    #
+    def metrics_export(self, summary, success=True):
+        if not self.metrics_textfile:
+            return
+        try:
+            MetricsExporter(self.metrics_textfile).write(summary, success)
+        except Exception as e:
+            self.logger.warning("The run metrics could not be written to the textfile: {} - {}"
+                                .format(self.metrics_textfile, e))
 
     # Checks the log directory for all files and removes those after a specified number of days
     #
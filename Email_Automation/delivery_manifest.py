@@ -0,0 +1,75 @@
+# delivery_manifest module
+# Module holds the class => DeliveryManifest - manages the record of zip files delivered to the sFTP server
+# Class responsible for reading and appending the manifest file, an entry per delivered zip file holding its path,
+# size, mtime and content hash, so a re-run can skip files that are already on the server
+#
+import json
+import os
+import hashlib
+import threading
+from datetime import datetime
+import logging
+
+
+class DeliveryManifest(object):
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.load()
+
+    # Reads the manifest file, the latest entry for each zip file path is kept
+    #
+    def load(self):
+        if not os.path.isfile(self.manifest_file):
+            return
+        with open(self.manifest_file, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a partial last line left by an interrupted run is ignored
+                    continue
+                self.entries[entry["zip_path"]] = entry
+
+    # Returns the manifest entry for the zip file if the local file still has the recorded size and mtime
+    #
+    def lookup(self, zip_path):
+        entry = self.entries.get(zip_path)
+        if entry is None:
+            return None
+        file_stat = os.stat(zip_path)
+        if entry["size"] != file_stat.st_size or entry["mtime"] != file_stat.st_mtime:
+            return None
+        return entry
+
+    # Appends an entry for the delivered zip file, hashing the local file if the upload did not
+    #
+    def record(self, zip_path, remote_path, sha256=None):
+        file_stat = os.stat(zip_path)
+        entry = {
+            "zip_path":     zip_path,
+            "remote_path":  remote_path,
+            "size":         file_stat.st_size,
+            "mtime":        file_stat.st_mtime,
+            "sha256":       sha256 or self.file_sha256(zip_path),
+            "delivered":    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self.lock:
+            with open(self.manifest_file, 'a') as file:
+                file.write(json.dumps(entry) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self.entries[zip_path] = entry
+        return entry
+
+    # Returns the sha256 of the local file, read in chunks
+    #
+    @staticmethod
+    def file_sha256(path, chunk_size=8388608):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
@@ -0,0 +1,67 @@
+# discovery_watermark module
+# Module holds the class => DiscoveryWatermark - manages the parent ticket set found by the earlier runs
+# Class responsible for reading and replacing the discovery cache file, holding the parent tickets (in their raw Jira
+# form) matching the parent ticket query at the last run and the high-water mark of that run, so the next run only
+# queries the tickets created or updated since then, with a full rescan when asked for, when the query changes or when
+# the last full rescan is older than the rescan period
+#
+from datetime import datetime, timedelta
+import json
+import os
+import logging
+
+
+class DiscoveryWatermark(object):
+    def __init__(self, cache_file, overlap_minutes=10, rescan_days=7):
+        self.cache_file = cache_file
+        # the watermark is moved back by the overlap to cover the minute resolution of jql dates and the search time
+        self.overlap_minutes = overlap_minutes
+        self.rescan_days = rescan_days
+        self.cache = {}
+        self.logger = logging.getLogger(__name__)
+        self.load()
+
+    # Reads the cache file, a missing or unreadable file leaves the cache empty so the next search is a full rescan
+    #
+    def load(self):
+        try:
+            with open(self.cache_file, 'r') as file:
+                self.cache = json.load(file)
+        except (OSError, ValueError):
+            self.cache = {}
+
+    # Returns the watermark to search from, as a jql date, or None if the search has to be a full rescan
+    #
+    def since(self, query, full_rescan=False):
+        if full_rescan or self.cache.get("query") != query or "watermark" not in self.cache:
+            return None
+        rescanned = datetime.strptime(self.cache["rescanned"], '%Y-%m-%d %H:%M:%S')
+        if self.rescan_days and datetime.now() - rescanned > timedelta(days=self.rescan_days):
+            self.logger.info("The last full rescan of the parent tickets was on {}, rescanning"
+                             .format(self.cache["rescanned"]))
+            return None
+        return self.cache["watermark"]
+
+    # Returns the raw tickets of the cached parent ticket set, keyed by the ticket key
+    #
+    def tickets(self):
+        return dict(self.cache.get("tickets", {}))
+
+    # Replaces the cache with the parent ticket set of this run, the watermark is Jira's time at the start of the
+    # search (in the search user's time zone) less the overlap, without a Jira time no watermark is kept and the next
+    # run rescans, replaced in a single step so a concurrent reader never sees a partial file
+    #
+    def save(self, query, jira_time, tickets, full_rescan):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cache = {
+            "query":        query,
+            "rescanned":    now if full_rescan else self.cache.get("rescanned", now),
+            "tickets":      tickets
+        }
+        if jira_time is not None:
+            cache["watermark"] = (jira_time - timedelta(minutes=self.overlap_minutes)).strftime('%Y-%m-%d %H:%M')
+        temp_file = "{}.tmp".format(self.cache_file)
+        with open(temp_file, 'w') as file:
+            json.dump(cache, file)
+        os.replace(temp_file, self.cache_file)
+        self.cache = cache
@@ -1,13 +1,72 @@
 # weekly_emailer module
 # Module holds the class => WeeklyEmailManager - manages the email creation and the smtp interface
 # Class responsible for all email related management
+# Module also holds the class => SMTPSession - manages a smtp connection shared by all the emails of a run
 #
-from smtplib import SMTP
+from smtplib import SMTP, SMTPServerDisconnected, SMTPResponseException
 from email.message import EmailMessage
 from datetime import datetime, timedelta
-from io import StringIO
+import threading
 import logging
 
+from receipt_attachment import ReceiptAttachment
+from run_metrics import RunMetrics
+
+
+class SMTPSession(object):
+	def __init__(self, mail_host, mail_port, metrics=None, timeout=None):
+		self.mail_host = mail_host
+		self.mail_port = int(mail_port)
+		# socket timeout (seconds) of the connection and of each command, None waits on the mail host indefinitely
+		self.timeout = timeout
+		self.smtp = None
+		self.lock = threading.Lock()
+		self.metrics = metrics if metrics is not None else RunMetrics()
+		self.logger = logging.getLogger(__name__)
+
+	# Opens the smtp connection if it is not already open and returns it
+	#
+	def connect(self):
+		if self.smtp is None:
+			self.smtp = SMTP(self.mail_host, self.mail_port, timeout=self.timeout)
+			self.logger.info("Connected to the mail host: {}:{}".format(self.mail_host, self.mail_port))
+		return self.smtp
+
+	# Sends the message over the shared connection, one message at a time, reconnecting once if the connection dropped,
+	# including a mail host closing a session left idle (e.g. over a long upload or between service runs) with a 421
+	#
+	def send_message(self, msg):
+		with self.lock, self.metrics.stage("smtp.send") as sample:
+			try:
+				self.connect().send_message(msg)
+			except (SMTPServerDisconnected, SMTPResponseException, ConnectionError) as e:
+				if isinstance(e, SMTPResponseException) and e.smtp_code != 421:
+					raise
+				self.logger.warning("The mail host connection was lost, reconnecting => {}".format(e))
+				sample["retries"] += 1
+				self.reset()
+				self.connect().send_message(msg)
+
+	# Drops the current connection without waiting on the server
+	#
+	def reset(self):
+		if self.smtp is not None:
+			try:
+				self.smtp.close()
+			finally:
+				self.smtp = None
+
+	# Ends the smtp session
+	#
+	def close(self):
+		with self.lock:
+			if self.smtp is not None:
+				try:
+					self.smtp.quit()
+				except Exception as e:
+					self.logger.warning("The mail host connection did not close cleanly => {}".format(e))
+				self.reset()
+
 
 class EmailManager(object):
 	def __init__(self, date_range, customer_name, account_data, subject, to_address, from_address, cc, sftp_server):
@@ -19,7 +78,7 @@ class EmailManager(object):
 		self.data_contract_id = account_data['data_contract_id']
 		self.file_name = "{}_{}.zip".format(customer_name, date_range)
 		self.msg = ""
-		self.attachment = StringIO()
+		self.attachment = ReceiptAttachment()
 		self.subj = subject
 		self.to_address = to_address
 		self.from_address = from_address
@@ -37,9 +96,10 @@ class EmailManager(object):
 		Oracle Team".format(date=date, mid=self.market_id, bid=self.beacon_id, dcid=self.data_contract_id,
 							server=sftp_server, fn=self.file_name, dr=date_range)
 
-	# Create the email in a text format then send via smtp, finally save the email as a StringIO file and return
+	# Create the email in a text format then send via smtp, over the shared smtp session when one is given, finally save
+	# the sent email as a receipt attachment and return
 	#
-	def weekly_emailer(self):
+	def weekly_emailer(self, smtp_session=None):
 		try:
 			# Simple Text Email
 			self.msg = EmailMessage()
@@ -52,15 +112,16 @@ class EmailManager(object):
 			self.msg.set_content(self.text)
 
 			# Send Email
-			with SMTP('mailhost.valkyrie.net') as smtp:
-				smtp.send_message(self.msg)
+			if smtp_session is not None:
+				smtp_session.send_message(self.msg)
+			else:
+				with SMTP('mailhost.valkyrie.net') as smtp:
+					smtp.send_message(self.msg)
 
 		except Exception as e:
 			self.logger.error("Email failed => {}".format(e))
 
 		else:
-			# Convert email to StringIO and return
-			msg_txt = bytes(self.msg).decode('utf-8')
-			self.attachment.write(msg_txt)
-			self.attachment.seek(0)
+			# Render the sent email once as the receipt attachment and return
+			self.attachment = ReceiptAttachment(self.msg.as_bytes())
 		return self.attachment
@@ -3,35 +3,111 @@
 # Class responsible for all the excel file interface, including file name search and data pull
 #
 from glob import glob
-from openpyxl import load_workbook
+import json
+import os
+import logging
 
 
 class ExcelManager(object):
     def __init__(self):
-        self.account_data = {}
+        self.account_index = {}
         self.account_file_name = ""
+        # workbook path, mtime and size the account index in memory was built from
+        self.index_key = None
+        self.logger = logging.getLogger(__name__)
 
-    # Open workbook and search for row number that corresponds to the ticket key
+    # Builds the account index, kept as it is when the workbook is unchanged since it was built, else served from the
+    # local cache file when the workbook is unchanged since it was written, otherwise the workbook is parsed and the
+    # cache file rewritten
     #
-    def excel_search(self, ticket, path):
+    def build_account_index(self, path, cache_file=""):
         self.account_file_name = self.get_file_name('{}/*.xlsx'.format(path))
-        wb = load_workbook(filename=self.account_file_name, data_only=True)
-        sheet = wb['Sheet1']
-        for row in range(1, sheet.max_row+1):
-            if sheet['A' + str(row)].value == ticket.key:
-                return row
+        if self.account_file_name is None:
+            raise FileNotFoundError("No account file was found in the directory: {}".format(path))
 
-    # With the matched row number as input, read and save account data for email population
-    #
-    def excel_read(self, row):
-        wb = load_workbook(filename=self.account_file_name)
-        sheet = wb['Sheet1']
-        self.account_data = {
-            "market_id":            sheet['B' + str(row)].value,
-            "beacon_id":            sheet['D' + str(row)].value,
-            "data_contract_id":     sheet['G' + str(row)].value
+        file_stat = os.stat(self.account_file_name)
+        cache_key = {
+            "path":     os.path.abspath(self.account_file_name),
+            "mtime":    file_stat.st_mtime,
+            "size":     file_stat.st_size
         }
-        return self.account_data
+        if cache_key == self.index_key:
+            self.logger.info("The account index in memory is current, the account file is unchanged")
+            return self.account_index
+
+        if cache_file:
+            cached_index = self.read_index_cache(cache_file, cache_key)
+            if cached_index is not None:
+                self.logger.info("The account index was loaded from the cache file: {}".format(cache_file))
+                self.account_index = cached_index
+                self.index_key = cache_key
+                return self.account_index
+
+        self.parse_account_file()
+        self.index_key = cache_key
+
+        if cache_file:
+            try:
+                self.write_index_cache(cache_file, cache_key)
+            except Exception as e:
+                self.logger.warning("The account index cache file: {} could not be written - {}".format(cache_file, e))
+        return self.account_index
+
+    # Open workbook once in read-only mode, stream the rows and index the account data by the ticket key (column A)
+    #
+    def parse_account_file(self):
+        # openpyxl is only imported when the workbook has to be parsed, not when the index is served from the cache
+        from openpyxl import load_workbook
+        self.account_index = {}
+        wb = load_workbook(filename=self.account_file_name, read_only=True, data_only=True)
+        try:
+            sheet = wb['Sheet1']
+            for row in sheet.iter_rows(min_col=1, max_col=7):
+                values = [cell.value for cell in row]
+                if not values or values[0] is None:
+                    continue
+                values += [None] * (7 - len(values))
+                # keep the first row found for a ticket key, matching the original top-down row search
+                self.account_index.setdefault(values[0], {
+                    "market_id":            values[1],
+                    "beacon_id":            values[3],
+                    "data_contract_id":     values[6]
+                })
+        finally:
+            wb.close()
+        return self.account_index
+
+    # Reads the cache file and returns the cached account index if it was written for the same workbook path, mtime
+    # and size, otherwise returns None
+    #
+    @staticmethod
+    def read_index_cache(cache_file, cache_key):
+        try:
+            with open(cache_file, 'r') as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if cache.get("workbook") != cache_key:
+            return None
+        return cache.get("accounts")
+
+    # Writes the account index with its workbook path, mtime and size to the cache file, replaced in a single step so
+    # a concurrent reader never sees a partial file
+    #
+    def write_index_cache(self, cache_file, cache_key):
+        temp_file = "{}.tmp".format(cache_file)
+        with open(temp_file, 'w') as file:
+            json.dump({"workbook": cache_key, "accounts": self.account_index}, file, default=str)
+        os.replace(temp_file, cache_file)
+
+    # With the account index built, look up and return the account data for email population
+    #
+    def account_lookup(self, ticket):
+        try:
+            return self.account_index[ticket.key]
+        except KeyError:
+            raise KeyError("Ticket: {} was not found in the account file: {}".format(ticket.key,
+                                                                                     self.account_file_name))
 
     # Search specified zfs folder for what should be the only file, get name and return
     #
@@ -3,127 +3,467 @@
 # Class responsible for all JIRA related interactions including ticket searching, data pull, file attaching, comment
 # posting and field updating.
 #
-from jira import JIRA
+from jira import JIRA, JIRAError
+from jira.resources import Issue
+from requests.structures import CaseInsensitiveDict
+from requests_toolbelt import MultipartEncoder
 import re
 from datetime import datetime, timedelta
-from operator import attrgetter
+from zoneinfo import ZoneInfo
+from multiprocessing.dummy import Pool as ThreadPool
+import threading
+import json
+import time
 import logging
 
+from run_metrics import RunMetrics
+
 
 class JiraManager(object):
-    def __init__(self, url, jira_token, email_file_name):
+    def __init__(self, url, jira_token, email_file_name, metrics=None, timeout=None):
         self.parent_tickets = []
-        self.child_tickets = None
-        self.jira = JIRA(url, basic_auth=jira_token)
+        self.child_tickets = {}
+        self.parent_keys_per_query = 200
+        # only the fields read by this automation are requested in searches, the found tickets are then used throughout
+        self.search_fields = 'summary,reporter,customfield_10431,customfield_10418,labels,duedate,parent'
+        # every Jira call is timed through the request method
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        # the socket timeout (seconds) of every request, None waits on the server indefinitely
+        self.jira = JIRA(url, basic_auth=jira_token, timeout=timeout)
+        # per-run cache of the searched/fetched tickets (search fields only) keyed by the ticket key
+        self.issue_cache = {}
+        self.cache_lock = threading.Lock()
+        # rate-limit (429) handling shared by all the ticket threads, the backoff doubles with each throttled request
+        # and halves with each successful one
+        self.throttle_lock = threading.Lock()
+        self.throttle_until = 0
+        self.throttle_delay = 0
+        self.throttle_min_delay = 1
+        self.throttle_max_delay = 60
+        self.throttle_retries = 5
+        # most tickets written at once by the write-back stage
+        self.write_back_workers = 8
+        # time zone jql dates are read in for the search user, looked up once
+        self.user_zone = None
         self.date_range = ""
         self.file_name = ""
         self.advert_field_name = ""
         self.advertiser_name = ""
         self.logger = logging.getLogger(__name__)
-        self.today_date = (datetime.now() - timedelta(hours=6)).strftime('%Y-%m-%d')
         self.ftp_posting_alert = 'The file has been loaded to the 1-Turn_Data_LicensingFiles directory on the ' \
                                  'ftp2.turn site.'
         self.email_file_name = "{}.txt".format(email_file_name)
         self.alert_name = 'RevenueRecognition'
         self.revenue_recognition_alert = 'the report delivery email has been attached.'
 
-    # Searches Jira for all tickets that match the parent ticket query criteria
+    # Searches Jira for all tickets that match the parent ticket query criteria, with a discovery watermark only the
+    # tickets created or updated since the last run are searched and merged into the cached parent ticket set
     #
-    def find_parent_tickets(self, issuetype, status, text):
+    def find_parent_tickets(self, issuetype, status, text, watermark=None, full_rescan=False):
         # Query to find qualified Jira Tickets, includes matches for text: including 'Turn' but excluding 'Test'
-        jql_query = "project IN (CAM) AND issuetype = " + issuetype + " AND status in " + status + " AND summary ~ " \
-                    + text + " ORDER BY " + " key "
-        self.parent_tickets = self.jira.search_issues(jql_query)
+        jql_base = "project IN (CAM) AND issuetype = " + issuetype
+        jql_criteria = jql_base + " AND status in " + status + " AND summary ~ " + text
+        if watermark is None:
+            self.parent_tickets = self.request(self.jira.search_issues, jql_criteria + " ORDER BY " + " key ",
+                                               fields=self.search_fields)
+        else:
+            self.parent_tickets = self.find_parent_tickets_since(jql_base, jql_criteria, watermark, full_rescan)
+        self.cache_issues(self.parent_tickets)
         return self.parent_tickets
 
+    # Searches Jira for the parent tickets changed since the watermark and merges them into the cached parent ticket
+    # set: the changed tickets still matching the criteria are added or refreshed, those no longer matching (closed,
+    # renamed) are dropped, a full rescan replaces the set
+    #
+    def find_parent_tickets_since(self, jql_base, jql_criteria, watermark, full_rescan):
+        try:
+            started = self.jira_now()
+        except Exception as e:
+            self.logger.warning("The Jira server time could not be read, the next run rescans - {}".format(e))
+            started = None
+        since = watermark.since(jql_criteria, full_rescan)
+        if since is None:
+            self.logger.info("Full rescan of the parent tickets")
+            found = self.request(self.jira.search_issues, jql_criteria, maxResults=False, fields=self.search_fields)
+            tickets = {ticket.key: ticket for ticket in found}
+        else:
+            # every ticket of the issue type changed since the watermark, then which of them still match the criteria
+            jql_since = ' AND updated >= "{}"'.format(since)
+            changed = self.request(self.jira.search_issues, jql_base + jql_since, maxResults=False,
+                                   fields=self.search_fields)
+            matching = set()
+            if changed:
+                matching = {ticket.key for ticket in self.request(self.jira.search_issues, jql_criteria + jql_since,
+                                                                  maxResults=False, fields='summary')}
+            tickets = {key: Issue(self.jira._options, self.jira._session, raw=raw)
+                       for key, raw in watermark.tickets().items()}
+            for ticket in changed:
+                if ticket.key in matching:
+                    tickets[ticket.key] = ticket
+                else:
+                    tickets.pop(ticket.key, None)
+            self.logger.info("{} parent ticket(s) changed since {}, {} of them match the criteria"
+                             .format(len(changed), since, len(matching)))
+
+        try:
+            watermark.save(jql_criteria, started, {key: ticket.raw for key, ticket in tickets.items()},
+                           since is None)
+        except Exception as e:
+            self.logger.warning("The parent ticket set could not be saved to: {} - the next run rescans - {}"
+                                .format(watermark.cache_file, e))
+        return sorted(tickets.values(), key=lambda ticket: (ticket.key.split('-')[0], int(ticket.key.split('-')[-1])))
+
     # Retrieves the required data from parent ticket to populate email
     #
     def parent_information_pull(self, ticket):
-        ticket = self.jira.issue(ticket.key)
+        ticket = self.get_issue(ticket)
         # Selects the final split value in the 'Summary' field and strips it of beginning and ending whitespace
-        self.advert_field_name = ticket.fields.summary.split('-')[-1].strip()
+        advert_field_name = ticket.fields.summary.split('-')[-1].strip()
         # Creates a name list split along whitespace and also splits if CamelHump notation exists
-        split_name = re.sub('(?!^)([A-Z][a-z]+)', r' \1', self.advert_field_name).split()
+        split_name = re.sub('(?!^)([A-Z][a-z]+)', r' \1', advert_field_name).split()
         # Remove '_' character from words in list if exists
         split_name = ' '.join(split_name).replace('_', '').split()
-        self.advertiser_name = self.normalize_name(split_name)
-        return self.advertiser_name
+        # the local values are returned as tickets are pulled from several threads at once
+        advertiser_name = self.normalize_name(split_name)
+        self.advert_field_name, self.advertiser_name = advert_field_name, advertiser_name
+        return advertiser_name
 
     # Searches Jira for tickets that are sub-tasks of the list of parent tickets and require an email to be sent
     #
     def find_child_tickets(self, ticket, status, label):
-        jql_query = "parent in (" + ticket.key + ") AND status = " + status + " AND labels = " + label
-        self.child_tickets = self.jira.search_issues(jql_query)
-        if self.child_tickets:
-            # this ensures you are returning only the latest child ticket, useful for dev purposes
-            self.child_tickets.sort(key=attrgetter('key'), reverse=True)
-            # return the latest ticket from list
-            return self.child_tickets.pop(0)
-        else:
-            return None
+        return self.find_child_tickets_bulk([ticket], status, label).get(ticket.key)
+
+    # Searches Jira for the sub-tasks of all the parent tickets with a single query (split only for very long parent
+    # lists), fetching every page of results, and returns a map of parent ticket key to its latest child ticket
+    #
+    def find_child_tickets_bulk(self, tickets, status, label):
+        child_tickets = {}
+        parent_keys = [ticket.key for ticket in tickets]
+        for i in range(0, len(parent_keys), self.parent_keys_per_query):
+            jql_query = "parent in (" + ", ".join(parent_keys[i:i + self.parent_keys_per_query]) + ") AND status = " \
+                        + status + " AND labels = " + label
+            for child_ticket in self.request(self.jira.search_issues, jql_query, maxResults=False,
+                                             fields=self.search_fields):
+                self.cache_issues([child_ticket])
+                parent_key = child_ticket.fields.parent.key
+                latest_ticket = child_tickets.get(parent_key)
+                # this ensures you are returning only the latest child ticket, useful for dev purposes
+                if latest_ticket is None or self.key_number(child_ticket) > self.key_number(latest_ticket):
+                    child_tickets[parent_key] = child_ticket
+        self.child_tickets = child_tickets
+        return self.child_tickets
 
     # Retrieves the required data from child ticket to populate email
     #
     def child_information_pull(self, ticket):
-        ticket = self.jira.issue(ticket.key)
+        ticket = self.get_issue(ticket)
         start_date = datetime.strptime(ticket.fields.customfield_10431, "%Y-%m-%d").strftime("%Y-%m-%d")
         end_date = datetime.strptime(ticket.fields.customfield_10418, "%Y-%m-%d").strftime("%Y-%m-%d")
-        self.date_range = "{}_{}".format(start_date, end_date)
-        return self.date_range
+        date_range = "{}_{}".format(start_date, end_date)
+        self.date_range = date_range
+        return date_range
 
     # Add a text file copy of ftp time stamp as an attachment to ticket
     #
     def add_ftp_attachment(self, ticket, attachment):
-        self.jira.add_attachment(issue=ticket.key, attachment=attachment, filename="ftp_time_stamp.txt")
-        self.jira.add_attachment(issue=ticket.key, attachment=attachment, filename="ftp_time_stamp.txt.png")
+        self.add_attachment(ticket, attachment, "ftp_time_stamp.txt")
+        self.add_attachment(ticket, attachment, "ftp_time_stamp.txt.png")
 
     # Add a text file copy of email as an attachment to ticket
     #
     def add_email_attachment(self, ticket, attachment):
-        self.jira.add_attachment(issue=ticket.key, attachment=attachment, filename=self.email_file_name)
+        self.add_attachment(ticket, attachment, self.email_file_name)
 
     # Add a comment on ticket with zip file posting alert
     #
     def add_ftp_posting_comment(self, ticket, zip_file_name):
-        ticket = self.jira.issue(ticket.key)
+        self.add_comment(ticket, self.ftp_posting_message(ticket, zip_file_name))
 
-        reporter = ticket.fields.reporter.key
+    # Add a comment on ticket to alert 'Revenue Recognition' that a copy of email has been attached to ticket
+    #
+    def add_rr_alert_comment(self, ticket):
+        self.add_comment(ticket, self.rr_alert_message(ticket))
+
+    # Creates the zip file posting alert comment
+    #
+    def ftp_posting_message(self, ticket, zip_file_name):
+        reporter = self.get_issue(ticket).fields.reporter.key
         message = """{zip_alert}
 
                      {zip_file_name}.zip""".format(reporter, zip_alert=self.ftp_posting_alert,
                                                    zip_file_name=zip_file_name)
-        self.jira.add_comment(issue=ticket, body=message)
+        return message
 
-    # Add a comment on ticket to alert 'Revenue Recognition' that a copy of email has been attached to ticket
+    # Creates the 'Revenue Recognition' alert comment
     #
-    def add_rr_alert_comment(self, ticket):
-        ticket = self.jira.issue(ticket.key)
-        reporter = ticket.fields.reporter.key
+    def rr_alert_message(self, ticket):
+        reporter = self.get_issue(ticket).fields.reporter.key
         message = """[~{attention}] {rr_alert}""".format(reporter, attention=self.alert_name,
                                                          rr_alert=self.revenue_recognition_alert)
-        self.jira.add_comment(issue=ticket, body=message)
+        return message
 
     # Change the field 'Due' on the child ticket to the current date
     #
     def update_duedate_field(self, ticket):
-        ticket.fields.duedate = self.today_date
-        ticket.update(fields={'duedate': ticket.fields.duedate})
+        self.update_fields(ticket, {'duedate': self.due_date()})
 
-    # Change the field 'labels' in the child ticket to the value 'Email_Sent' to omit from future search results
+    # Change the field 'labels' in the child ticket to the value 'Email_Sent' to omit from future search results, any
+    # existing labels are replaced in the same update
     #
-    @staticmethod
-    def update_labels_field(ticket):
-        # first, remove any existing labels
-        ticket.update(labels=None)
-        # next, create and add a new custom label
-        ticket.fields.labels.append(u'Email_Sent')
-        ticket.update(fields={'labels': ticket.fields.labels})
+    def update_labels_field(self, ticket):
+        self.update_fields(ticket, {'labels': [u'Email_Sent']})
 
     # Transition the ticket status field to 'Complete' -> id ='621' w/o Rev-Rec
     #
     def progress_ticket(self, ticket):
-        ticket = self.jira.issue(ticket.key)
-        self.jira.transition_issue(ticket, '621')
+        self.transition_issue(ticket, '621')
+
+    # Creates an empty write-back plan for the ticket, holding the attachments, comments, field edits and transition
+    # to be written to it
+    #
+    @staticmethod
+    def write_plan(ticket):
+        return {"ticket": ticket, "attachments": [], "comments": [], "fields": {}, "transition": None}
+
+    # Adds the ftp posting updates to the plan: the ftp time stamp attachments, the zip file posting alert and the
+    # transition to 'Complete', the 'Due' date is added by plan_due_date
+    #
+    def plan_ftp_posting(self, plan, attachment, zip_file_name):
+        plan["attachments"] += [(attachment, "ftp_time_stamp.txt"), (attachment, "ftp_time_stamp.txt.png")]
+        plan["comments"].append(self.ftp_posting_message(plan["ticket"], zip_file_name))
+        plan["transition"] = '621'
+        return plan
+
+    # Adds the 'Due' date to the plan's field edits
+    #
+    @staticmethod
+    def plan_due_date(plan, due_date):
+        plan["fields"]['duedate'] = due_date
+        return plan
+
+    # Adds the email updates to the plan: the email attachment, the 'Revenue Recognition' alert and the 'Email_Sent'
+    # label
+    #
+    def plan_email_posting(self, plan, attachment):
+        plan["attachments"].append((attachment, self.email_file_name))
+        plan["comments"].append(self.rr_alert_message(plan["ticket"]))
+        plan["fields"]['labels'] = [u'Email_Sent']
+        return plan
+
+    # Writes the plans of several tickets, concurrently across the tickets, then retries the failed updates, returns
+    # an outcome per ticket listing the updates done, the errors and the plan of updates still to be retried
+    #
+    def write_back(self, plans, retries=1):
+        outcomes = self.write_back_run(plans)
+        for _ in range(retries):
+            retry_plans = [outcome["retry"] for outcome in outcomes if outcome["retry"] is not None]
+            if not retry_plans:
+                break
+            retried = {outcome["ticket"]: outcome for outcome in self.write_back_run(retry_plans)}
+            for outcome in outcomes:
+                if outcome["ticket"] in retried:
+                    retry_outcome = retried[outcome["ticket"]]
+                    outcome["done"] += retry_outcome["done"]
+                    outcome["errors"] = retry_outcome["errors"]
+                    outcome["retry"] = retry_outcome["retry"]
+        return outcomes
+
+    # Writes the plans once, the ticket's plan directly for a single ticket, otherwise a ticket per write-back thread
+    #
+    def write_back_run(self, plans):
+        if len(plans) == 1:
+            return [self.write_back_ticket(plans[0])]
+        with ThreadPool(processes=min(len(plans), self.write_back_workers)) as write_pool:
+            return write_pool.map(self.write_back_ticket, plans)
+
+    # Writes one ticket's plan: the attachments and comments, all field edits in a single update, then the transition;
+    # a failed update doesn't stop the others and is kept in the plan returned for retry
+    #
+    def write_back_ticket(self, plan):
+        ticket = plan["ticket"]
+        retry = self.write_plan(ticket)
+        outcome = {"ticket": ticket.key, "done": [], "errors": [], "retry": None}
+
+        for attachment, filename in plan["attachments"]:
+            try:
+                self.add_attachment(ticket, attachment, filename)
+            except Exception as e:
+                retry["attachments"].append((attachment, filename))
+                outcome["errors"].append("attachment {} => {}".format(filename, e))
+            else:
+                outcome["done"].append("attachment {}".format(filename))
+
+        for message in plan["comments"]:
+            try:
+                self.add_comment(ticket, message)
+            except Exception as e:
+                retry["comments"].append(message)
+                outcome["errors"].append("comment => {}".format(e))
+            else:
+                outcome["done"].append("comment")
+
+        if plan["fields"]:
+            try:
+                self.update_fields(ticket, plan["fields"])
+            except Exception as e:
+                retry["fields"] = plan["fields"]
+                outcome["errors"].append("fields {} => {}".format(", ".join(plan["fields"]), e))
+            else:
+                outcome["done"].append("fields {}".format(", ".join(plan["fields"])))
+
+        if plan["transition"] is not None:
+            try:
+                self.transition_issue(ticket, plan["transition"])
+            except Exception as e:
+                retry["transition"] = plan["transition"]
+                outcome["errors"].append("transition {} => {}".format(plan["transition"], e))
+            else:
+                outcome["done"].append("transition {}".format(plan["transition"]))
+
+        if outcome["errors"]:
+            outcome["retry"] = retry
+        return outcome
+
+    # Adds the receipt attachment to the ticket under the filename, the same buffer is uploaded for every filename
+    #
+    def add_attachment(self, ticket, attachment, filename):
+        self.request(self.post_attachment, ticket, attachment, filename)
+
+    # Streams the receipt to the ticket's attachments endpoint as a multipart body with the receipt's content type,
+    # read from offset zero on every call so a throttled upload is retried in full
+    #
+    def post_attachment(self, ticket, attachment, filename):
+        self.metrics.count("jira_attachment_bytes", attachment.size)
+        body = MultipartEncoder(fields={'file': (filename, attachment.stream(), attachment.content_type)})
+        response = self.jira._session.post(self.jira._get_url('issue/{}/attachments'.format(ticket.key)), data=body,
+                                           headers=CaseInsensitiveDict({'content-type': body.content_type,
+                                                                        'X-Atlassian-Token': 'nocheck'}))
+        attached = response.json()
+        if not attached or not attached[0].get('size'):
+            raise JIRAError("The attachment: {} was not added to Jira Ticket: {}".format(filename, ticket.key))
+        return attached[0]
+
+    # Sets the fields on the ticket with a single PUT, the ticket isn't reloaded afterwards as the written values are
+    # set on the ticket and its cached copy
+    #
+    def update_fields(self, ticket, fields):
+        self.request(self.jira._session.put, ticket.self, data=json.dumps({'fields': fields}))
+        for field, value in fields.items():
+            setattr(ticket.fields, field, value)
+            self.cache_update(ticket, field, value)
+
+    # Fetches the current status name of the ticket, always from Jira
+    #
+    def ticket_status(self, ticket):
+        return self.request(self.jira.issue, ticket.key, fields='status').fields.status.name
+
+    # Returns True if the ticket's current status matches the required status, given as in the jql (quoted or not)
+    #
+    def status_reached(self, ticket, status):
+        return self.ticket_status(ticket) == status.strip("'\"")
+
+    # Polls the ticket status until it matches the required status, returns False if not matched within the timeout
+    #
+    def wait_for_status(self, ticket, status, timeout, interval):
+        deadline = time.time() + timeout
+        while True:
+            if self.status_reached(ticket, status):
+                return True
+            if time.time() + interval > deadline:
+                return False
+            time.sleep(interval)
+
+    # Adds a comment to the ticket and drops the ticket from the issue cache
+    #
+    def add_comment(self, ticket, message):
+        self.request(self.jira.add_comment, issue=ticket.key, body=message)
+        self.cache_invalidate(ticket)
+
+    # Transitions the ticket and drops the ticket from the issue cache, the workflow may change other fields
+    #
+    def transition_issue(self, ticket, transition_id):
+        self.request(self.jira.transition_issue, ticket.key, transition_id)
+        self.cache_invalidate(ticket)
+
+    # Runs a Jira call, on a rate-limit response waits for the Retry-After time or the adaptive backoff then retries
+    #
+    def request(self, function_call, *args, **kwargs):
+        with self.metrics.stage("jira.{}".format(function_call.__name__)) as sample:
+            for attempt in range(self.throttle_retries + 1):
+                self.throttle_wait()
+                try:
+                    result = function_call(*args, **kwargs)
+                except JIRAError as e:
+                    if e.status_code != 429 or attempt == self.throttle_retries:
+                        raise
+                    sample["retries"] += 1
+                    self.throttled(e)
+                else:
+                    with self.throttle_lock:
+                        half_delay = self.throttle_delay / 2
+                        self.throttle_delay = half_delay if half_delay >= self.throttle_min_delay else 0
+                    return result
+
+    # Sleeps until the time set by the last rate-limit response, so all threads back off together
+    #
+    def throttle_wait(self):
+        with self.throttle_lock:
+            delay = self.throttle_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    # Sets the time to wait after a rate-limit response, from the Retry-After header when given
+    #
+    def throttled(self, error):
+        retry_after = None
+        if error.response is not None:
+            try:
+                retry_after = float(error.response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = None
+        with self.throttle_lock:
+            self.throttle_delay = min(self.throttle_max_delay, max(self.throttle_min_delay, self.throttle_delay * 2))
+            delay = retry_after if retry_after is not None else self.throttle_delay
+            self.throttle_until = max(self.throttle_until, time.time() + delay)
+        self.logger.warning("Jira rate limit reached, backing off for {:.1f} second(s)".format(delay))
+
+    # Adds the searched/fetched tickets to the issue cache, replacing older copies
+    #
+    def cache_issues(self, tickets):
+        with self.cache_lock:
+            for ticket in tickets:
+                self.issue_cache[ticket.key] = ticket
+
+    # Returns the cached copy of the ticket, fetching the search fields from Jira only if the ticket is not cached
+    #
+    def get_issue(self, ticket):
+        with self.cache_lock:
+            cached_ticket = self.issue_cache.get(ticket.key)
+        if cached_ticket is None:
+            cached_ticket = self.request(self.jira.issue, ticket.key, fields=self.search_fields)
+            self.cache_issues([cached_ticket])
+        return cached_ticket
+
+    # Sets a written field value on the cached copy of the ticket
+    #
+    def cache_update(self, ticket, field, value):
+        with self.cache_lock:
+            cached_ticket = self.issue_cache.get(ticket.key)
+            if cached_ticket is not None:
+                setattr(cached_ticket.fields, field, value)
+                cached_ticket.raw['fields'][field] = value
+
+    # Empties the issue cache, the next run reads its tickets from Jira again
+    #
+    def cache_clear(self):
+        with self.cache_lock:
+            self.issue_cache = {}
+
+    # Removes the ticket from the issue cache, the next read fetches it again
+    #
+    def cache_invalidate(self, ticket):
+        with self.cache_lock:
+            self.issue_cache.pop(ticket.key, None)
 
     # Applies rules to normalize the Advertiser names into Data Enablement accepted file-naming convention
     #
@@ -151,6 +491,33 @@ class JiraManager(object):
 
         return advertiser_name
 
+    # Returns the numeric part of the ticket key, used to order tickets by creation
+    #
+    @staticmethod
+    def key_number(ticket):
+        return int(ticket.key.split('-')[-1])
+
+    # Returns Jira's current time in the search user's time zone, the zone the jql dates are read in, so the discovery
+    # watermark doesn't depend on the clock or time zone of this host
+    #
+    def jira_now(self):
+        server_time = datetime.strptime(self.request(self.jira.server_info)["serverTime"], '%Y-%m-%dT%H:%M:%S.%f%z')
+        if self.user_zone is None:
+            try:
+                self.user_zone = ZoneInfo(self.request(self.jira.myself)["timeZone"])
+            except Exception as e:
+                # without a zone of its own the user's jql dates are read in the server's default zone
+                self.logger.warning("The time zone of the Jira user could not be read, the server's is used - {}"
+                                    .format(e))
+                self.user_zone = server_time.tzinfo
+        return server_time.astimezone(self.user_zone).replace(tzinfo=None)
+
+    # Returns today's date for the 'Due' date field, read at each use as the service mode keeps the manager for days
+    #
+    @staticmethod
+    def due_date():
+        return (datetime.now() - timedelta(hours=6)).strftime('%Y-%m-%d')
+
     # Ends the current JIRA session
     #
     def kill_session(self):
@@ -25,6 +25,16 @@
 #                       sftp_manager.py,
 #                       email_manager.py,
 #                       excel_manager.py,
+#                       delivery_manifest.py,
+#                       async_engine.py,
+#                       receipt_attachment.py,
+#                       run_metrics.py,
+#                       metrics_exporter.py,
+#                       run_profiler.py,
+#                       run_journal.py,
+#                       discovery_watermark.py,
+#                       trigger_service.py,
+#                       secret_cache.py,
 #                       config.ini
 # Deployed Location:    //prd-use1a-pr-34-ci-operations-01/home/bradley.ruck/Projects/data_enablement_emailer/
 # ActiveBatch Trigger:  //onlinemodelingdev/Jobs, Folders & Plans/Report/DE_Email/
@@ -44,14 +54,23 @@
 # the Data Enablement Email Manager (DEEM), finally it launches the purge_files method to remove log files that are
 # older than a prescribed retention period
 # Updated to include the option of running a console logger for development purposes, bypassed in production
+# Updated to include the option of profiling a run (--profile), the reports are written next to the log file, in the
+# service mode each trigger run is profiled and its reports are numbered by run
+# Updated to include the option of a full rescan of the parent tickets (--full-rescan) instead of the incremental search
+# Updated to include a service mode (--service) that watches the trigger folder and runs the process for each trigger
+# file dropped in it, keeping the Jira session, sFTP and smtp connections and the account index warm between runs
 #
 from datetime import datetime, timedelta
+import argparse
 import os
 import configparser
 import logging
 
 from VaultClient3 import VaultClient3 as VaultClient
+from secret_cache import SecretCache
 from data_enablement_email_manager import DataEnablementEmailManager
+from run_profiler import RunProfiler
+from trigger_service import TriggerService
 
 
 # Define a console logger for development purposes
@@ -67,49 +86,76 @@ def console_logger():
     logging.getLogger('').addHandler(console)
 
 
-def main(con_opt='n'):
+def main(con_opt='n', profile=False, full_rescan=False, service=False):
     today_date = (datetime.now() - timedelta(hours=6)).strftime('%Y%m%d-%H%M%S')
 
     # create a configparser object and open in read mode
     config = configparser.ConfigParser()
     config.read('config.ini')
 
-    # Vault Client Objects
+    # Vault Client Objects, the secrets are kept in process memory for their time to live, the ssh key is read when the
+    # sFTP connections are opened
     VC_Obj = VaultClient("prod")
-    jira_pd = VC_Obj.VaultSecret('jira', str(config.get('Jira', 'authorization')))
-    ssh_key = VC_Obj.VaultSecret('ssh', str(config.get('sFTP', 'authorization')))
+    secrets = SecretCache(VC_Obj.VaultSecret, config.getfloat('Vault', 'secret_ttl'))
+    jira_pd = secrets.get('jira', str(config.get('Jira', 'authorization')))
+    ssh_key = secrets.reader('ssh', str(config.get('sFTP', 'authorization')))
+
+    # logfile path to point to the Operations_limited drive on zfs
+    purge_days = config.get('LogFile', 'retention_days')
+    log_file_path = config.get('LogFile', 'path')
+    log_name = '{}{}_{}'.format(log_file_path, config.get('Project Details', 'app_name'), today_date)
+    logfile_name = '{}.log'.format(log_name)
 
     # create a dictionary of configuration parameters
     config_params = {
         "email_file_name":          config.get('Project Details', 'file_name'),
         "running_mode":             config.get('Project Details', 'running_mode'),
+        "max_workers":              config.getint('Project Details', 'max_workers'),
+        "task_timeout":             config.getfloat('Project Details', 'task_timeout'),
+        "io_timeout":               config.getfloat('Project Details', 'io_timeout'),
+        "engine":                   config.get('Project Details', 'engine'),
+        "async_jira_limit":         config.getint('Project Details', 'async_jira_limit'),
+        "journal_file":             config.get('Project Details', 'journal_file'),
         "sftp_server":              config.get('Project Details', 'sftp'),
         "jira_url":                 config.get('Jira', 'url'),
         "jira_token":               tuple([config.get('Jira', 'authorization'), jira_pd]),
         "jql_status_parent":        config.get('Jira', 'status_parent'),
         "jql_status_child_sftp":    config.get('Jira', 'status_child_sftp'),
         "jql_status_child_email":   config.get('Jira', 'status_child_email'),
+        "jira_status_poll_interval": config.getfloat('Jira', 'status_poll_interval'),
+        "jira_status_poll_timeout": config.getfloat('Jira', 'status_poll_timeout'),
         "jql_issuetype":            config.get('Jira', 'issuetype'),
         "jql_label":                config.get('Jira', 'label'),
         "jql_text":                 config.get('Jira', 'text'),
+        "jira_discovery_cache_file": config.get('Jira', 'discovery_cache_file'),
+        "jira_discovery_overlap":   config.getint('Jira', 'discovery_overlap_minutes'),
+        "jira_discovery_rescan_days": config.getint('Jira', 'discovery_rescan_days'),
+        "jira_full_rescan":         full_rescan,
+        "keep_warm":                service,
         "ssh_key":                  ssh_key,
         "sftp_url":                 config.get('sFTP', 'url'),
+        "sftp_port":                config.getint('sFTP', 'port'),
+        "sftp_known_hosts":         config.get('sFTP', 'known_hosts'),
         "sftp_user":                config.get('sFTP', 'user'),
-        "sftp_path_to_keyfile":     config.get('sFTP', 'path_to_keyfile'),
         "sftp_folder_path":         config.get('sFTP', 'ftp_folder_path'),
+        "sftp_max_connections":     config.getint('sFTP', 'max_connections'),
+        "sftp_resume_uploads":      config.getboolean('sFTP', 'resume_uploads'),
+        "sftp_chunk_size":          config.getint('sFTP', 'chunk_size'),
+        "sftp_manifest_file":       config.get('sFTP', 'manifest_file'),
         "sftp_zip_file_path":       config.get('sFTP', 'zip_file_path'),
         "excel_path":               config.get('ExcelFile', 'path'),
+        "excel_cache_file":         config.get('ExcelFile', 'cache_file'),
         "email_subject":            config.get('Email', 'subject'),
         "email_to":                 config.get('Email', 'to'),
         "email_from":               config.get('Email', 'from'),
-        "email_cc":                 config.get('Email', 'cc')
+        "email_cc":                 config.get('Email', 'cc'),
+        "email_mail_host":          config.get('Email', 'mail_host'),
+        "email_mail_port":          config.getint('Email', 'mail_port'),
+        "metrics_file":             ('{}_metrics.json'.format(log_name)
+                                     if config.getboolean('LogFile', 'metrics_summary') else ""),
+        "metrics_textfile":         config.get('LogFile', 'prometheus_textfile')
     }
 
-    # logfile path to point to the Operations_limited drive on zfs
-    purge_days = config.get('LogFile', 'retention_days')
-    log_file_path = config.get('LogFile', 'path')
-    logfile_name = '{}{}_{}.log'.format(log_file_path, config.get('Project Details', 'app_name'), today_date)
-
     # check to see if log file already exits for the day to avoid duplicate execution
     if not os.path.isfile(logfile_name):
         logging.basicConfig(filename=logfile_name,
@@ -129,14 +175,48 @@ def main(con_opt='n'):
 
         # create DEEM object and launch Email Generator
         de_emailer = DataEnablementEmailManager(config_params)
-        de_emailer.process_manager()
+
+        # serve the trigger files dropped in the trigger folder until stopped, every run reusing the same DEEM object,
+        # each run profiled on its own when profiling is asked for
+        if service:
+            TriggerService(de_emailer, config.get('Service', 'trigger_path'),
+                           config.getfloat('Service', 'poll_interval'), purge_days, log_file_path,
+                           log_name if profile else None).run()
+            return
+
+        # profile the run with cProfile and tracemalloc, the reports are named after the log file
+        profiler = RunProfiler(log_name) if profile else None
+        success = False
+        if profiler is not None:
+            profiler.start()
+        try:
+            de_emailer.process_manager()
+            success = True
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            # log the stage timings of the run, write the run summary next to the log file and export the run metrics,
+            # also for a run that ended on an error
+            de_emailer.metrics_export(de_emailer.run_summary(), success)
 
         # search logfile directory for old log files to purge
         de_emailer.purge_files(purge_days, log_file_path)
 
 
 if __name__ == '__main__':
-    # prompt user for use of console logging -> for use in development not production
-    ans = input("\nWould you like to enable a console logger for this run?\n Please enter y or n:\t")
-    print()
-    main(ans)
+    parser = argparse.ArgumentParser(description="Data Enablement - Data Append, TURN-Weekly Emailer")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the run (each trigger run in service mode) with cProfile and tracemalloc, "
+                             "reports are written next to the log file")
+    parser.add_argument('--full-rescan', action='store_true',
+                        help="search all the parent tickets instead of those changed since the last run")
+    parser.add_argument('--service', action='store_true',
+                        help="run as a service, watching the trigger folder and keeping the connections warm")
+    args = parser.parse_args()
+
+    # prompt user for use of console logging -> for use in development not production, the service runs unattended
+    ans = 'n'
+    if not args.service:
+        ans = input("\nWould you like to enable a console logger for this run?\n Please enter y or n:\t")
+        print()
+    main(ans, args.profile, args.full_rescan, args.service)
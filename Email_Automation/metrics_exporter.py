@@ -0,0 +1,102 @@
+# metrics_exporter module
+# Module holds the class => MetricsExporter - manages the Prometheus textfile of the run
+# Class responsible for rendering the run summary (run duration, ticket counts, upload throughput, Jira request counts
+# and latencies, smtp send latency and the stage latencies) in the Prometheus text format and replacing the textfile
+# read by the node exporter textfile collector
+#
+import os
+import time
+import logging
+
+
+class MetricsExporter(object):
+    def __init__(self, textfile, prefix='deem'):
+        self.textfile = textfile
+        self.prefix = prefix
+        self.logger = logging.getLogger(__name__)
+
+    # Writes the metrics of the run summary to the textfile, replaced in a single step so the collector never reads a
+    # partial file
+    #
+    def write(self, summary, success=True):
+        temp_file = "{}.tmp".format(self.textfile)
+        with open(temp_file, 'w') as file:
+            file.write(self.render(summary, success))
+        os.replace(temp_file, self.textfile)
+        self.logger.info("The run metrics were written to the textfile: {}".format(self.textfile))
+
+    # Returns the metrics of the run summary in the Prometheus text format
+    #
+    def render(self, summary, success=True):
+        counters = summary["counters"]
+        stages = summary["stages"]
+        lines = []
+
+        self.family(lines, "run_duration_seconds", "gauge", "Duration of the last run in seconds.",
+                    [({}, summary["duration"])])
+        self.family(lines, "run_timestamp_seconds", "gauge", "Unix time the last run finished.",
+                    [({}, round(time.time(), 3))])
+        self.family(lines, "run_success", "gauge", "1 if the last run finished without an error and with no failed "
+                    "tickets, otherwise 0.", [({}, 1 if success and not counters.get("tickets_failed") else 0)])
+        self.family(lines, "tickets", "gauge", "Tickets of the last run by state.",
+                    [({"state": state}, counters.get("tickets_{}".format(state), 0))
+                     for state in ("found", "posted", "emailed", "failed")])
+
+        upload = stages.get("sftp.put", {"bytes": 0, "total": 0, "retries": 0})
+        self.family(lines, "upload_bytes", "gauge", "Bytes uploaded to the sFTP server in the last run.",
+                    [({}, upload["bytes"])])
+        self.family(lines, "upload_throughput_bytes_per_second", "gauge",
+                    "Bytes uploaded per second of upload time in the last run.",
+                    [({}, round(upload["bytes"] / upload["total"], 3) if upload["total"] else 0)])
+        self.family(lines, "upload_retries", "gauge", "Resumed upload attempts in the last run.",
+                    [({}, upload["retries"])])
+
+        jira_calls = sorted((name.split('.', 1)[1], stage) for name, stage in stages.items()
+                            if name.startswith("jira."))
+        self.family(lines, "jira_requests", "gauge", "Jira requests of the last run by call.",
+                    [({"call": call}, stage["count"]) for call, stage in jira_calls])
+        self.family(lines, "jira_request_errors", "gauge", "Failed Jira requests of the last run by call.",
+                    [({"call": call}, stage["errors"]) for call, stage in jira_calls])
+        self.family(lines, "jira_rate_limit_retries", "gauge", "Jira requests retried after a rate-limit response.",
+                    [({"call": call}, stage["retries"]) for call, stage in jira_calls])
+        self.summary_family(lines, "jira_request_seconds", "Jira request latency of the last run by call.",
+                            [({"call": call}, stage) for call, stage in jira_calls])
+
+        self.summary_family(lines, "smtp_send_seconds", "smtp send latency of the last run.",
+                            [({}, stages["smtp.send"])] if "smtp.send" in stages else [])
+
+        self.summary_family(lines, "stage_seconds", "Duration of the run, ticket and sFTP stages of the last run.",
+                            [({"stage": name}, stage) for name, stage in sorted(stages.items())
+                             if not name.startswith(("jira.", "smtp."))])
+        return "\n".join(lines) + "\n"
+
+    # Adds a metric family with its help and type lines and a sample per label set
+    #
+    def family(self, lines, name, metric_type, help_text, samples):
+        name = "{}_{}".format(self.prefix, name)
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, metric_type))
+        for labels, value in samples:
+            lines.append("{}{} {}".format(name, self.labels(labels), value))
+
+    # Adds a summary family from the stages, with the p50 and p95 quantiles, the sum and the count of each label set
+    #
+    def summary_family(self, lines, name, help_text, stages):
+        name = "{}_{}".format(self.prefix, name)
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} summary".format(name))
+        for labels, stage in stages:
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+                lines.append("{}{} {}".format(name, self.labels(dict(labels, quantile=quantile)), stage[key]))
+            lines.append("{}_sum{} {}".format(name, self.labels(labels), stage["total"]))
+            lines.append("{}_count{} {}".format(name, self.labels(labels), stage["count"]))
+
+    # Returns the label set in the text format, the values escaped
+    #
+    @staticmethod
+    def labels(labels):
+        if not labels:
+            return ""
+        return "{{{}}}".format(",".join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                                        .replace('\n', '\\n'))
+                                        for name, value in sorted(labels.items())))
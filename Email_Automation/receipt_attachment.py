@@ -0,0 +1,31 @@
+# receipt_attachment module
+# Module holds the class => ReceiptAttachment - manages a receipt file attached to Jira tickets
+# Class responsible for holding a receipt (ftp time stamp or email copy) rendered once as bytes, with its content type,
+# in a single in-memory buffer that every upload of the receipt reads from its start
+#
+from io import BytesIO
+
+
+class ReceiptAttachment(object):
+    def __init__(self, content=b"", content_type="text/plain; charset=utf-8"):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.buffer = BytesIO(content)
+        self.size = len(content)
+        self.content_type = content_type
+
+    # Rewinds the buffer and returns it, so an upload always starts at offset zero whatever was read before
+    #
+    def stream(self):
+        self.buffer.seek(0)
+        return self.buffer
+
+    # Returns the receipt content, without moving the buffer position
+    #
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+    # Returns the receipt content as text
+    #
+    def text(self):
+        return self.getvalue().decode('utf-8')
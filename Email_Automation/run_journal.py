@@ -0,0 +1,94 @@
+# run_journal module
+# Module holds the class => RunJournal - manages the record of the ticket stages completed by the runs
+# Class responsible for reading and appending the journal file, an entry per completed stage of a ticket (parent
+# ticket enriched, zip file uploaded and verified, Jira updated for the posting, email sent, Jira updated for the email)
+# holding what is needed to carry on from that stage, so a run restarted after a crash resumes each ticket from its last
+# completed stage instead of repeating uploads, emails and Jira writes
+#
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+import logging
+
+
+class RunJournal(object):
+    # the stages of a ticket in the order they are completed
+    stages = ('enriched', 'uploaded', 'verified', 'jira_sftp_updated', 'emailed', 'jira_email_updated')
+
+    def __init__(self, journal_file, retention_days=30):
+        self.journal_file = journal_file
+        self.retention_days = retention_days
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.load()
+
+    # Reads the journal file, the latest entry for each ticket stage is kept
+    #
+    def load(self):
+        if not os.path.isfile(self.journal_file):
+            return
+        with open(self.journal_file, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a partial last line left by a crashed run is ignored
+                    continue
+                self.entries.setdefault(entry["ticket"], {})[entry["stage"]] = entry
+        if self.entries:
+            self.logger.info("The run journal holds completed stages for {} ticket(s) from earlier runs"
+                             .format(len(self.entries)))
+
+    # Returns the data recorded with the ticket stage, or None if the stage has not been completed
+    #
+    def completed(self, ticket_key, stage):
+        with self.lock:
+            entry = self.entries.get(ticket_key, {}).get(stage)
+        return None if entry is None else entry["data"]
+
+    # Appends an entry for the completed ticket stage with its data, flushed to disk before returning
+    #
+    def record(self, ticket_key, stage, **data):
+        entry = {
+            "ticket":       ticket_key,
+            "stage":        stage,
+            "recorded":     datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "data":         data
+        }
+        with self.lock:
+            with open(self.journal_file, 'a') as file:
+                file.write(json.dumps(entry) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self.entries.setdefault(ticket_key, {})[stage] = entry
+        return entry
+
+    # Rewrites the journal at the end of a run that finished, keeping only the tickets still part way through their
+    # stages: tickets that completed the final stage of the running mode (or a later one), the parent ticket
+    # enrichments and entries older than the retention period are dropped
+    #
+    def compact(self, final_stage='jira_email_updated'):
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        finished = self.stages[self.stages.index(final_stage):]
+        with self.lock:
+            kept = {}
+            for ticket_key, ticket_stages in self.entries.items():
+                if any(stage in ticket_stages for stage in finished):
+                    continue
+                ticket_stages = {stage: entry for stage, entry in ticket_stages.items()
+                                 if stage != 'enriched' and entry["recorded"] >= cutoff}
+                if ticket_stages:
+                    kept[ticket_key] = ticket_stages
+            temp_file = "{}.tmp".format(self.journal_file)
+            with open(temp_file, 'w') as file:
+                for ticket_stages in kept.values():
+                    for stage in self.stages:
+                        if stage in ticket_stages:
+                            file.write(json.dumps(ticket_stages[stage]) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_file, self.journal_file)
+            self.entries = kept
+        return len(kept)
@@ -0,0 +1,155 @@
+# run_metrics module
+# Module holds the class => RunMetrics - manages the timing instrumentation of a run
+# Class responsible for recording the duration, bytes transferred, retries and failures of each stage of the run and
+# of each Jira, sFTP and smtp call, per ticket where the ticket is known, then summarizing them at the end of the run
+# as json and as a table with the p50/p95 per stage
+#
+from contextlib import contextmanager
+from datetime import datetime
+import threading
+import json
+import math
+import time
+import logging
+
+
+class RunMetrics(object):
+    def __init__(self):
+        self.started = time.time()
+        self.start_counter = time.perf_counter()
+        # one (stage, ticket, seconds, bytes, retries, ok) sample per timed call, appended under the lock
+        self.samples = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        # ticket being worked on by the current thread, inherited by the calls timed within its stage
+        self.local = threading.local()
+        self.logger = logging.getLogger(__name__)
+
+    # Starts a new run, the samples and counters of the last run are dropped
+    #
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.start_counter = time.perf_counter()
+            self.samples = []
+            self.counters = {}
+
+    # Times the block as a sample of the stage, recorded as failed if the block raises, the ticket given becomes the
+    # current ticket of the thread for the calls timed within the block
+    #
+    @contextmanager
+    def stage(self, name, ticket=None):
+        previous_ticket = getattr(self.local, 'ticket', None)
+        if ticket is not None:
+            self.local.ticket = ticket
+        sample = {"bytes": 0, "retries": 0}
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield sample
+            ok = True
+        finally:
+            self.local.ticket = previous_ticket
+            self.record(name, time.perf_counter() - start, ticket or previous_ticket, sample["bytes"],
+                        sample["retries"], ok)
+
+    # Runs the call with the ticket as the current ticket of the thread, for a call handed to a pool thread on the
+    # ticket's behalf, e.g. by the asyncio engine's executor
+    #
+    def run_as(self, ticket, function_call, *args, **kwargs):
+        previous_ticket = getattr(self.local, 'ticket', None)
+        self.local.ticket = ticket
+        try:
+            return function_call(*args, **kwargs)
+        finally:
+            self.local.ticket = previous_ticket
+
+    # Records a sample of the stage
+    #
+    def record(self, name, seconds, ticket=None, bytes_sent=0, retries=0, ok=True):
+        if ticket is None:
+            ticket = getattr(self.local, 'ticket', None)
+        with self.lock:
+            self.samples.append((name, ticket, seconds, bytes_sent, retries, ok))
+
+    # Adds to a run level counter, e.g. the tickets found
+    #
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Returns the value at the percentile of the sorted values (nearest rank)
+    #
+    @staticmethod
+    def percentile(values, percent):
+        if not values:
+            return 0
+        return values[max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)]
+
+    # Returns the summary of the run: the run level counters, the count, total, p50, p95 and max seconds, bytes,
+    # retries and errors of each stage, and the seconds, bytes and retries of each ticket by stage
+    #
+    def summary(self):
+        with self.lock:
+            samples = list(self.samples)
+            counters = dict(self.counters)
+
+        stages = {}
+        tickets = {}
+        for name, ticket, seconds, bytes_sent, retries, ok in samples:
+            stage = stages.setdefault(name, {"durations": [], "bytes": 0, "retries": 0, "errors": 0})
+            stage["durations"].append(seconds)
+            stage["bytes"] += bytes_sent
+            stage["retries"] += retries
+            stage["errors"] += 0 if ok else 1
+            if ticket is not None:
+                ticket_stage = tickets.setdefault(ticket, {}).setdefault(name, {"seconds": 0, "bytes": 0,
+                                                                                "retries": 0})
+                ticket_stage["seconds"] = round(ticket_stage["seconds"] + seconds, 6)
+                ticket_stage["bytes"] += bytes_sent
+                ticket_stage["retries"] += retries
+
+        for stage in stages.values():
+            durations = sorted(stage.pop("durations"))
+            stage.update({
+                "count":    len(durations),
+                "total":    round(sum(durations), 6),
+                "p50":      round(self.percentile(durations, 50), 6),
+                "p95":      round(self.percentile(durations, 95), 6),
+                "max":      round(durations[-1], 6)
+            })
+
+        return {
+            "started":          datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S'),
+            "duration":         round(time.perf_counter() - self.start_counter, 6),
+            "counters":         counters,
+            "stages":           stages,
+            "tickets":          tickets
+        }
+
+    # Returns the stage table of the summary, slowest total first
+    #
+    @staticmethod
+    def table(summary):
+        lines = ["{:<32} {:>6} {:>10} {:>10} {:>10} {:>10} {:>14} {:>7} {:>6}".format(
+            "stage", "count", "total s", "p50 ms", "p95 ms", "max ms", "bytes", "retries", "errors")]
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["total"]):
+            lines.append("{:<32} {:>6} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.1f} {:>14,} {:>7} {:>6}".format(
+                name, stage["count"], stage["total"], stage["p50"] * 1000, stage["p95"] * 1000, stage["max"] * 1000,
+                stage["bytes"], stage["retries"], stage["errors"]))
+        lines.append("run duration: {:.3f} s, {}".format(summary["duration"], ", ".join(
+            "{}: {}".format(name, value) for name, value in sorted(summary["counters"].items()))))
+        return "\n".join(lines)
+
+    # Logs the stage table and, when a file is given, writes the summary to it as json, returns the summary
+    #
+    def report(self, summary_file=""):
+        summary = self.summary()
+        self.logger.info("Run summary ->\n{}\n".format(self.table(summary)))
+        if summary_file:
+            try:
+                with open(summary_file, 'w') as file:
+                    json.dump(summary, file, indent=2)
+            except Exception as e:
+                self.logger.warning("The run summary could not be written to: {} - {}".format(summary_file, e))
+        return summary
@@ -0,0 +1,119 @@
+# run_profiler module
+# Module holds the class => RunProfiler - manages the profiling of a run
+# Class responsible for profiling the run with cProfile, in the main thread and in every thread started during the
+# run (the ticket worker threads), and tracing its memory allocations with tracemalloc, then writing the .prof file,
+# a text report of the hot spots and a report of the top allocations next to the log file
+#
+import cProfile
+import pstats
+import tracemalloc
+import threading
+import io
+import logging
+
+
+class RunProfiler(object):
+    def __init__(self, report_name, top=40, trace_frames=10):
+        # file names are built from the log file name without its extension, e.g. <path>/<app_name>_<timestamp>
+        self.prof_file = "{}.prof".format(report_name)
+        self.profile_report = "{}_profile.txt".format(report_name)
+        self.allocation_report = "{}_allocations.txt".format(report_name)
+        self.top = top
+        self.trace_frames = trace_frames
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.start_snapshot = None
+        self.logger = logging.getLogger(__name__)
+
+    # Starts profiling the current thread and each thread started from now on, and starts tracing allocations
+    #
+    def start(self):
+        tracemalloc.start(self.trace_frames)
+        self.start_snapshot = tracemalloc.take_snapshot()
+        threading.setprofile(self.thread_start)
+        self.new_profile()
+        self.logger.info("Profiling the run, reports will be written to: {}".format(self.prof_file))
+
+    # Runs as the first profile event of a new thread, hands the thread over to its own cProfile profiler
+    #
+    def thread_start(self, frame, event, arg):
+        self.new_profile()
+
+    # Creates and enables a profiler for the current thread
+    #
+    def new_profile(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # from Python 3.12 the profiler of the main thread already covers every thread
+            return None
+        with self.lock:
+            self.profiles.append(profile)
+        return profile
+
+    # Stops profiling and tracing, then writes the reports, a failure to write a report doesn't fail the run
+    #
+    def stop(self):
+        threading.setprofile(None)
+        for profile in self.profiles:
+            profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        try:
+            self.write_profile()
+        except Exception as e:
+            self.logger.warning("The profile could not be written to: {} - {}".format(self.prof_file, e))
+        try:
+            self.write_allocations(snapshot, current, peak)
+        except Exception as e:
+            self.logger.warning("The allocation report could not be written to: {} - {}"
+                                .format(self.allocation_report, e))
+
+    # Merges the profiles of all the threads, dumps them to the .prof file (for pstats/snakeviz) and writes the top
+    # functions by cumulative and by own time
+    #
+    def write_profile(self):
+        with self.lock:
+            profiles = list(self.profiles)
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is None:
+            return
+        stats.dump_stats(self.prof_file)
+
+        report = io.StringIO()
+        report.write("Profile of {} thread(s)\n\n".format(len(profiles)))
+        stats.stream = report
+        stats.sort_stats('cumulative').print_stats(self.top)
+        stats.sort_stats('tottime').print_stats(self.top)
+        with open(self.profile_report, 'w') as file:
+            file.write(report.getvalue())
+        self.logger.info("The run profile was written to: {} and {}".format(self.prof_file, self.profile_report))
+
+    # Writes the memory in use and its peak, the top allocation sites still held at the end of the run and the top
+    # growth since the start of the run
+    #
+    def write_allocations(self, snapshot, current, peak):
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        lines = ["Traced memory at the end of the run: {:,} bytes, peak: {:,} bytes".format(current, peak), "",
+                 "Top {} allocation sites held at the end of the run:".format(self.top)]
+        lines += [str(statistic) for statistic in snapshot.statistics('lineno')[:self.top]]
+        lines += ["", "Top {} allocation sites by growth since the start of the run:".format(self.top)]
+        lines += [str(statistic) for statistic in snapshot.compare_to(self.start_snapshot, 'lineno')[:self.top]]
+        lines += ["", "Traceback of the largest allocation site:"]
+        largest = snapshot.statistics('traceback')[:1]
+        if largest:
+            lines += largest[0].traceback.format()
+        with open(self.allocation_report, 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        self.logger.info("The allocation report was written to: {}".format(self.allocation_report))
@@ -0,0 +1,44 @@
+# secret_cache module
+# Module holds the class => SecretCache - manages the secrets read from Vault by the process
+# Class responsible for keeping each secret read through the fetch function (the Vault client) in process memory for a
+# short time to live, so the connections opened within a run, or by a long-running process, don't read Vault again
+# while a rotated secret is still picked up once its entry has expired
+#
+from functools import partial
+import threading
+import time
+import logging
+
+
+class SecretCache(object):
+    def __init__(self, fetch, ttl=300):
+        # fetch function called with the secret engine and path, e.g. VaultClient.VaultSecret
+        self.fetch = fetch
+        self.ttl = ttl
+        # (value, expiry) per (engine, path), the expiry on the monotonic clock
+        self.secrets = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    # Returns the secret, read through the fetch function only when it is not cached or its entry has expired
+    #
+    def get(self, engine, path):
+        with self.lock:
+            entry = self.secrets.get((engine, path))
+            if entry is not None and time.monotonic() < entry[1]:
+                return entry[0]
+            value = self.fetch(engine, path)
+            self.secrets[(engine, path)] = (value, time.monotonic() + self.ttl)
+            self.logger.info("The {} secret was read from the vault".format(engine))
+            return value
+
+    # Returns a function that reads the secret through the cache, for the consumers that read it at each use
+    #
+    def reader(self, engine, path):
+        return partial(self.get, engine, path)
+
+    # Drops all the cached secrets
+    #
+    def clear(self):
+        with self.lock:
+            self.secrets = {}
@@ -3,65 +3,327 @@
 # Class responsible for all sFTP related interactions including connecting to server and posting files
 #
 import pysftp
-import time
+import paramiko
 from io import StringIO
+import time
+import os
+import hashlib
+from queue import Queue, Empty
+from contextlib import contextmanager
+import threading
 import logging
 
+from receipt_attachment import ReceiptAttachment
+from run_metrics import RunMetrics
+
 
 class sFTPManager(object):
-    def __init__(self, sftp_url, sftp_user, path_to_keyfile, sftp_folder_path):
+    def __init__(self, sftp_url, sftp_user, private_key, sftp_folder_path, max_connections=1,
+                 resume_uploads=False, chunk_size=8388608, port=22, known_hosts="", metrics=None, timeout=None):
         self.sftp_url = sftp_url
+        self.port = int(port)
+        # host keys file checked against the server's host key, the user's ~/.ssh/known_hosts when not given
+        self.known_hosts = known_hosts or None
         self.sftp_user = sftp_user
-        self.path_to_keyfile = path_to_keyfile
+        # private key as a paramiko key object held in memory (see load_private_key), or the path of a key file
+        self.private_key = private_key
         self.sftp_folder_path = sftp_folder_path
-        self.sftp = None
+        self.max_connections = max(1, int(max_connections))
+        self.ftp_directory = sftp_folder_path
+        self.resume_uploads = resume_uploads
+        self.chunk_size = int(chunk_size)
+        # socket timeout (seconds) of each sftp read and write, None waits on the server indefinitely
+        self.timeout = timeout
+        # attempts made to complete a resumable upload, each attempt resumes from the size already on the server
+        self.upload_attempts = 3
+        # short backoff (seconds) between remote stat retries when an uploaded file is not yet visible
+        self.verify_backoff = (0.5, 1, 2, 4)
+        # pool of idle connections, each upload checks out its own connection so uploads run in parallel
+        self.pool = Queue()
+        self.open_count = 0
+        self.pool_lock = threading.Lock()
+        self.metrics = metrics if metrics is not None else RunMetrics()
         self.logger = logging.getLogger(__name__)
 
-    # Opens a sFTP connection to server and changes to correct directory
+    # Opens the pool of sFTP connections to server, each changed to the correct directory
     #
     def open_connection(self):
-        self.sftp = pysftp.Connection(self.sftp_url, username=self.sftp_user, private_key=self.path_to_keyfile)
-        self.sftp.cwd(self.sftp_folder_path)
-        return self.sftp
+        for _ in range(self.max_connections):
+            try:
+                self.pool.put(self.new_connection())
+            except Exception as e:
+                # the run needs only one connection, extra connections are opened as the server allows
+                if self.open_count == 0:
+                    raise
+                self.logger.warning("Only {} connection(s) could be opened to the sFTP server - {}"
+                                    .format(self.open_count, e))
+                break
+            self.open_count += 1
+        # the resolved working directory is recorded once for the ftp attachment text
+        with self.connection() as sftp:
+            self.ftp_directory = sftp.pwd
+        self.logger.info("{} connection(s) opened to the sFTP server: {}".format(self.open_count, self.sftp_url))
+        return self.open_count
+
+    # Returns the paramiko key object of the private key text, trying each supported key type, so connections are
+    # opened with no key file written to disk
+    #
+    @staticmethod
+    def load_private_key(key_text):
+        errors = []
+        for key_class in (paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key, paramiko.DSSKey):
+            try:
+                return key_class.from_private_key(StringIO(key_text))
+            except (paramiko.SSHException, ValueError) as e:
+                errors.append("{}: {}".format(key_class.__name__, e))
+        raise paramiko.SSHException("The private key could not be read => {}".format("; ".join(errors)))
 
-    # Copies the zip file from zfs/Technology location to ftp server
+    # Opens a single sFTP connection to server and changes to correct directory
+    #
+    def new_connection(self):
+        with self.metrics.stage("sftp.connect"):
+            sftp = pysftp.Connection(self.sftp_url, username=self.sftp_user, private_key=self.private_key,
+                                     port=self.port, cnopts=pysftp.CnOpts(knownhosts=self.known_hosts))
+            sftp.timeout = self.timeout
+            sftp.cwd(self.sftp_folder_path)
+        return sftp
+
+    # Checks out an idle connection from the pool for the length of one operation, a connection left broken by a
+    # failed operation is replaced so that the failure stays with that one file
+    #
+    @contextmanager
+    def connection(self):
+        sftp = None
+        while sftp is None:
+            with self.pool_lock:
+                if self.open_count == 0:
+                    raise IOError("There are no open connections to the sFTP server: {}".format(self.sftp_url))
+            try:
+                sftp = self.pool.get(timeout=1)
+            except Empty:
+                pass
+        try:
+            yield sftp
+        except Exception:
+            if not self.is_active(sftp):
+                sftp = self.replace_connection(sftp)
+            raise
+        finally:
+            if sftp is not None:
+                self.pool.put(sftp)
+
+    # Closes a broken connection and opens its replacement, returns None and shrinks the pool if it can't be reopened
+    #
+    def replace_connection(self, sftp):
+        try:
+            sftp.close()
+        except Exception:
+            pass
+        try:
+            return self.new_connection()
+        except Exception as e:
+            self.logger.error("A broken connection to the sFTP server could not be reopened - {}".format(e))
+            with self.pool_lock:
+                self.open_count -= 1
+            return None
+
+    # Returns whether the ssh transport under the connection is still active
+    #
+    @staticmethod
+    def is_active(sftp):
+        try:
+            return sftp.sftp_client.get_channel().get_transport().is_active()
+        except Exception:
+            return False
+
+    # Copies the zip file from zfs/Technology location to ftp server, returns the upload details for the attachment
     #
     def sftp_put(self, child_ticket_zfs_path, zip_file_name):
-        self.sftp.put("{}{}".format(child_ticket_zfs_path, zip_file_name),
-                      "{}{}".format(self.sftp_folder_path, zip_file_name))
+        local_path = "{}{}".format(child_ticket_zfs_path, zip_file_name)
+        remote_path = "{}{}".format(self.sftp_folder_path, zip_file_name)
+        with self.metrics.stage("sftp.put") as sample:
+            if not self.resume_uploads:
+                with self.connection() as sftp:
+                    sftp.put(local_path, remote_path)
+                sample["bytes"] = os.path.getsize(local_path)
+                return {"bytes_sent": sample["bytes"], "resumed_from": 0, "sha256": None,
+                        "remote_checksum": None, "delivered": None}
+
+            for attempt in range(1, self.upload_attempts + 1):
+                try:
+                    with self.connection() as sftp:
+                        upload = self.resumable_put(sftp, local_path, remote_path)
+                        sample["bytes"] += upload["bytes_sent"]
+                        return upload
+                except Exception as e:
+                    if attempt == self.upload_attempts:
+                        raise
+                    sample["retries"] += 1
+                    self.logger.warning("Upload attempt {} of the file: {} failed, resuming - {}"
+                                        .format(attempt, zip_file_name, e))
+
+    # Uploads only the part of the file missing from the server with large pipelined writes, then verifies the
+    # remote size and, where the server supports it, a remote checksum against the local streaming hash
+    #
+    def resumable_put(self, sftp, local_path, remote_path):
+        local_size = os.path.getsize(local_path)
+        try:
+            remote_size = sftp.stat(remote_path).st_size
+        except FileNotFoundError:
+            remote_size = 0
+        # a remote file larger than the local file is not a partial copy of it, start again from byte zero
+        offset = remote_size if remote_size <= local_size else 0
+        # nor is a remote file whose last bytes differ from the local file at the same place, e.g. the zip file
+        # regenerated for the same week, it is uploaded again from byte zero rather than appended to or kept
+        if offset and not self.remote_prefix_matches(sftp, local_path, remote_path, offset):
+            self.logger.info("The ftp file: {} is not a partial copy of: {}, uploading it again"
+                             .format(remote_path, local_path))
+            offset = 0
+        if offset:
+            self.logger.info("Resuming the upload of: {} from byte {:,} of {:,}".format(local_path, offset, local_size))
 
-    # Retrieves the attributes for the zip file after it has been copied to ftp server, includes required time stamp
+        digest = hashlib.sha256()
+        bytes_sent = 0
+        with open(local_path, 'rb') as local_file:
+            # the part already on the server is read locally only to complete the hash
+            remaining = offset
+            while remaining:
+                chunk = local_file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+
+            with sftp.open(remote_path, 'r+' if offset else 'w', bufsize=self.chunk_size) as remote_file:
+                remote_file.seek(offset)
+                remote_file.set_pipelined(True)
+                while True:
+                    chunk = local_file.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    remote_file.write(chunk)
+                    digest.update(chunk)
+                    bytes_sent += len(chunk)
+
+        remote_size = sftp.stat(remote_path).st_size
+        if remote_size != local_size:
+            raise IOError("The ftp file: {} is {:,} bytes, expected {:,} bytes".format(remote_path, remote_size,
+                                                                                      local_size))
+
+        remote_checksum = self.remote_checksum(sftp, remote_path)
+        if remote_checksum is not None and remote_checksum != digest.hexdigest():
+            # a corrupt copy is removed so that the next attempt uploads the whole file again
+            sftp.remove(remote_path)
+            raise IOError("The ftp file: {} failed the checksum verification".format(remote_path))
+
+        return {"bytes_sent": bytes_sent, "resumed_from": offset, "sha256": digest.hexdigest(),
+                "remote_checksum": remote_checksum is not None, "delivered": None}
+
+    # Returns whether the remote file is a partial copy of the local file, by comparing its last chunk (up to the
+    # offset) with the local bytes at the same place
+    #
+    def remote_prefix_matches(self, sftp, local_path, remote_path, offset):
+        length = min(self.chunk_size, offset)
+        with open(local_path, 'rb') as local_file:
+            local_file.seek(offset - length)
+            local_tail = local_file.read(length)
+        with sftp.open(remote_path, 'r', bufsize=self.chunk_size) as remote_file:
+            remote_file.seek(offset - length)
+            remote_tail = remote_file.read(length)
+        return remote_tail == local_tail
+
+    # Checks that a zip file recorded in the delivery manifest is still on the server with the recorded size and, where
+    # the server supports it, the recorded checksum, returns the upload details for the attachment or None if not
+    #
+    def delivered_upload(self, zip_file_name, entry):
+        remote_path = "{}{}".format(self.sftp_folder_path, zip_file_name)
+        with self.metrics.stage("sftp.delivered_check"), self.connection() as sftp:
+            try:
+                remote_size = sftp.stat(remote_path).st_size
+            except FileNotFoundError:
+                return None
+            if remote_size != entry["size"]:
+                return None
+            remote_checksum = self.remote_checksum(sftp, remote_path)
+        if remote_checksum is not None and remote_checksum != entry["sha256"]:
+            return None
+        return {"bytes_sent": 0, "resumed_from": 0, "sha256": entry["sha256"],
+                "remote_checksum": remote_checksum is not None, "delivered": entry["delivered"]}
+
+    # Returns the server computed sha256 of the remote file, or None when the server doesn't support the check-file
+    # extension
+    #
+    @staticmethod
+    def remote_checksum(sftp, remote_path):
+        try:
+            with sftp.open(remote_path, 'r') as remote_file:
+                return remote_file.check('sha256').hex()
+        except IOError:
+            return None
+
+    # Retrieves the attributes for the zip file after it has been copied to ftp server, includes required time stamp,
+    # with a remote stat of the one uploaded path, retried with a short backoff only while the file is not found
+    #
+    def verify_upload(self, zip_file_name):
+        remote_path = "{}{}".format(self.sftp_folder_path, zip_file_name)
+        with self.metrics.stage("sftp.verify") as sample:
+            for delay in self.verify_backoff + (None,):
+                try:
+                    with self.connection() as sftp:
+                        attribute = sftp.stat(remote_path)
+                except FileNotFoundError:
+                    if delay is None:
+                        raise
+                    sample["retries"] += 1
+                    self.logger.info("The ftp file: {} was not found yet, checking again in {} second(s)"
+                                     .format(zip_file_name, delay))
+                    time.sleep(delay)
+                else:
+                    attribute.filename = zip_file_name
+                    return attribute
+
+    # Retrieves the attributes for all the files in the ftp server directory
     #
     def get_attributes(self):
-        return self.sftp.listdir_attr()
+        with self.connection() as sftp:
+            return sftp.listdir_attr()
 
     # Retrieves a directory list from ftp server
     #
     def dir_list(self):
-        return self.sftp.listdir()
-
-    # Creates a stringIO file object for the Jira ticket as a verification of zip file placement on ftp server
-    #
-    def create_stringio(self, file_name, attributes):
-        attachment_file = StringIO()
-        msg = ""
-        for attribute in attributes:
-            if attribute.filename == file_name:
-                self.logger.info("ftp file attributes: {}".format(attribute))
-                msg += 'File Name: {}'.format(attribute.filename)
-                msg += '\n\tLocation on ftp Server ->    {}:{}'.format(self.sftp_url.ljust(20), self.sftp.pwd.rjust(20))
-                msg += '\n\tLast Access Time             {}:{}'.format("".ljust(20), time.ctime(attribute.st_atime).rjust(20))
-                msg += '\n\tCreated or Last Modified Time{}:{}'.format("".ljust(20), time.ctime(attribute.st_mtime).rjust(20))
-                msg += '\n\tFile Size                    {}:{:,} bytes'.format("".ljust(20), attribute.st_size)
-                attachment_file.write(msg)
-                return attachment_file
-            else:
-                pass
+        with self.connection() as sftp:
+            return sftp.listdir()
+
+    # Creates the receipt attachment for the Jira ticket as a verification of zip file placement on ftp server
+    #
+    def create_receipt(self, attribute, upload=None):
+        self.logger.info("ftp file attributes: {}".format(attribute))
+        msg = 'File Name: {}'.format(attribute.filename)
+        msg += '\n\tLocation on ftp Server ->    {}:{}'.format(self.sftp_url.ljust(20), self.ftp_directory.rjust(20))
+        msg += '\n\tLast Access Time             {}:{}'.format("".ljust(20), time.ctime(attribute.st_atime).rjust(20))
+        msg += '\n\tCreated or Last Modified Time{}:{}'.format("".ljust(20), time.ctime(attribute.st_mtime).rjust(20))
+        msg += '\n\tFile Size                    {}:{:,} bytes'.format("".ljust(20), attribute.st_size)
+        if upload is not None and upload["sha256"] is not None:
+            msg += '\n\tSHA-256 (local file)         {}:{}'.format("".ljust(20), upload["sha256"])
+            msg += '\n\tChecksum Verified on Server  {}:{}'.format(
+                "".ljust(20), "Yes" if upload["remote_checksum"] else "Not supported, size verified")
+            if upload["delivered"]:
+                msg += '\n\tAlready Delivered On         {}:{}'.format("".ljust(20), upload["delivered"])
+            if upload["resumed_from"] and upload["bytes_sent"]:
+                msg += '\n\tResumed From                 {}:{:,} bytes'.format("".ljust(20), upload["resumed_from"])
+        return ReceiptAttachment(msg)
 
-        self.logger.info("The ftp file: {}, was not found on the server".format(file_name))
-        return attachment_file
+    # Returns whether every connection in the pool still has an active ssh transport
+    #
+    def connections_active(self):
+        with self.pool_lock:
+            connections = list(self.pool.queue)
+        return bool(connections) and len(connections) == self.open_count and \
+            all(sftp.sftp_client.get_channel().get_transport().is_active() for sftp in connections)
 
-    # Closes the sFTP connection
+    # Closes all the sFTP connections
     #
     def close_connection(self):
-        self.sftp.close()
+        while not self.pool.empty():
+            self.pool.get().close()
+        self.open_count = 0
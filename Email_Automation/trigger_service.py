@@ -0,0 +1,98 @@
+# trigger_service module
+# Module holds the class => TriggerService - manages the long-running service mode of the Weekly Email Process
+# Class responsible for watching the trigger folder for the trigger files dropped by ActiveBatch and running the process
+# for each one with the same Data Enablement Email Manager, so the Jira session, the sFTP connections, the smtp
+# connection and the account index are kept warm between runs instead of being rebuilt by a new process per trigger
+#
+import signal
+import threading
+import os
+import logging
+
+from run_profiler import RunProfiler
+
+
+class TriggerService(object):
+    def __init__(self, de_emailer, trigger_path, poll_interval=5, purge_days=None, log_file_path="", profile_name=None):
+        self.de_emailer = de_emailer
+        self.trigger_path = trigger_path
+        self.poll_interval = poll_interval
+        self.purge_days = purge_days
+        self.log_file_path = log_file_path
+        # each run is profiled when a report name is given, its reports named after it and the run number
+        self.profile_name = profile_name
+        # trigger files that could not be consumed, not run again on every poll
+        self.ignored = set()
+        self.runs = 0
+        self.stopping = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    # Polls the trigger folder until the service is stopped (SIGTERM/SIGINT), running the process once per trigger file
+    # in the order they were dropped, then closes the warm connections
+    #
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.logger.info("Service mode - watching the trigger folder: {} every {} second(s)"
+                         .format(self.trigger_path, self.poll_interval))
+        try:
+            while not self.stopping.is_set():
+                for trigger_file in self.triggers():
+                    if self.stopping.is_set():
+                        break
+                    self.run_trigger(trigger_file)
+                self.stopping.wait(self.poll_interval)
+        finally:
+            self.de_emailer.connections_close()
+            self.logger.info("Service mode stopped after {} run(s)".format(self.runs))
+
+    # Asks the service to stop once the run in progress has finished
+    #
+    def stop(self, signum=None, frame=None):
+        self.logger.info("Service mode - stop requested")
+        self.stopping.set()
+
+    # Returns the trigger files waiting in the trigger folder, oldest first
+    #
+    def triggers(self):
+        try:
+            entries = [entry for entry in os.scandir(self.trigger_path)
+                       if entry.is_file() and not entry.name.startswith('.') and entry.path not in self.ignored]
+        except OSError as e:
+            self.logger.warning("The trigger folder: {} could not be read - {}".format(self.trigger_path, e))
+            return []
+        return [entry.path for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime)]
+
+    # Consumes the trigger file and runs the process, profiled when asked for, a failed run is logged and the service
+    # carries on with the next trigger
+    #
+    def run_trigger(self, trigger_file):
+        # the trigger is removed before the run so a run that fails is not repeated on every poll
+        try:
+            os.remove(trigger_file)
+        except OSError as e:
+            self.logger.error("The trigger file: {} could not be removed, it is ignored - {}".format(trigger_file, e))
+            self.ignored.add(trigger_file)
+            return
+
+        self.runs += 1
+        self.logger.info("Trigger file: {} found, starting run {}".format(trigger_file, self.runs))
+        de_emailer = self.de_emailer
+        de_emailer.run_reset()
+        profiler = None
+        if self.profile_name is not None:
+            profiler = RunProfiler("{}_run{}".format(self.profile_name, self.runs))
+            profiler.start()
+        success = False
+        try:
+            de_emailer.process_manager()
+            success = True
+        except (Exception, SystemExit) as e:
+            self.logger.error("The run for the trigger file: {} failed - {}".format(trigger_file, e))
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            de_emailer.metrics_export(de_emailer.run_summary(), success)
+
+        if self.purge_days is not None:
+            de_emailer.purge_files(self.purge_days, self.log_file_path)